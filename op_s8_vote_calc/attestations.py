@@ -1,6 +1,196 @@
 
-from eth_abi import decode
+from eth_abi import decode, encode
+from eth_abi.registry import registry
+from eth_abi.decoding import ContextFramesBytesIO
+from eth_abi.grammar import parse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import json
+import logging
+import os
+import re
+
+logr = logging.getLogger(__name__)
+
+# Below this many rows, starting worker processes costs more than it saves.
+MIN_ROWS_PER_PROCESS = 2000
+
+decoders = {}
+parsed = {}
+
+def tuple_decoder(types):
+
+    if types not in decoders:
+        decoders[types] = registry.get_tuple_decoder(*types)
+
+    return decoders[types]
+
+def parsed_types(types):
+
+    if types not in parsed:
+        parsed[types] = [parse(t) for t in types]
+
+    return parsed[types]
+
+def resolve_decode_processes(processes=None):
+
+    try:
+        processes = int(processes or os.getenv('S8_DECODE_PROCESSES', 1))
+        assert processes > 0
+    except:
+        processes = 1
+
+    return processes
+
+HEX = re.compile(r'(0x)?([0-9a-fA-F]{2})*')
+
+def ceil32(n):
+    return -(-n // 32) * 32
+
+def word(encoded, pos):
+    """The uint256 at `pos`, or None if the payload ends before it."""
+
+    if pos + 32 > len(encoded):
+        return None
+
+    return int.from_bytes(encoded[pos:pos + 32], 'big')
+
+def check_static(abi_type, encoded, pos):
+    """Why the static value at `pos` won't decode, or None."""
+
+    value = encoded[pos:pos + 32]
+
+    if len(value) < 32:
+        return f"{abi_type.to_type_str()} at {pos} runs past the end of the payload"
+
+    if abi_type.base in ('uint', 'int'):
+        padding = value[:32 - abi_type.sub // 8]
+        fill = b'\xff' if abi_type.base == 'int' and value[len(padding)] & 0x80 else b'\x00'
+        ok = padding == fill * len(padding)
+    elif abi_type.base == 'address':
+        ok = value[:12] == bytes(12)
+    elif abi_type.base == 'bool':
+        ok = value[:31] == bytes(31) and value[31] <= 1
+    elif abi_type.base == 'bytes':
+        ok = value[abi_type.sub:] == bytes(32 - abi_type.sub)
+    else:
+        ok = True
+
+    return None if ok else f"{abi_type.to_type_str()} at {pos} has non-empty padding"
+
+def check_tail(abi_type, encoded, pos):
+    """Why the dynamic value (a string, bytes or T[]) whose tail starts at `pos` won't decode, or None."""
+
+    length = word(encoded, pos)
+
+    if length is None:
+        return f"{abi_type.to_type_str()} at {pos} runs past the end of the payload"
+
+    start = pos + 32
+
+    if abi_type.is_array:
+        return check_items(abi_type.item_type, encoded, start, length)
+
+    if start + ceil32(length) > len(encoded):
+        return f"{abi_type.to_type_str()} at {pos} is longer than the payload"
+
+    if encoded[start + length:start + ceil32(length)] != bytes(ceil32(length) - length):
+        return f"{abi_type.to_type_str()} at {pos} has non-empty padding"
+
+    data = encoded[start:start + length]
+
+    # Valid UTF-8 is the only thing that survives dropping undecodable bytes unchanged.
+    if abi_type.base == 'string' and len(data.decode('utf-8', 'ignore').encode('utf-8')) != length:
+        return f"{abi_type.to_type_str()} at {pos} is not valid UTF-8"
+
+    return None
+
+def check_items(abi_types, encoded, start, count=None):
+    """
+    Why the head/tail encoded values starting at `start` won't decode, or None.
+
+    `abi_types` is a tuple's list of types, or one type repeated `count` times for a T[].  Mirrors
+    the bounds eth_abi enforces: every offset points past the heads and inside the payload.
+    """
+
+    if count is not None:
+        if start + 32 * count > len(encoded):
+            return f"{count} items at {start} run past the end of the payload"
+        abi_types = [abi_types] * count
+
+    heads_end = start + 32 * len(abi_types)
+
+    for i, abi_type in enumerate(abi_types):
+        head = start + 32 * i
+
+        if not abi_type.is_dynamic:
+            error = check_static(abi_type, encoded, head)
+        else:
+            offset = word(encoded, head)
+
+            if offset is None:
+                error = f"Offset at {head} runs past the end of the payload"
+            elif not heads_end <= start + offset < len(encoded):
+                error = f"Offset at {head} points outside the payload"
+            else:
+                error = check_tail(abi_type, encoded, start + offset)
+
+        if error:
+            return error
+
+    return None
+
+def decode_chunk(meta, datas, offset=0):
+    """
+    Decode a list of payloads, collecting (index, error) for the ones that don't decode instead of raising.
+
+    Every payload is checked first (hex, offsets and lengths in bounds, padding), then only the ones
+    that pass go through the decoder, so no one row needs a try/except.  Should the decoder still
+    reject one of them, the batch is decoded again a row at a time, and just that row is dropped.
+    """
+
+    results = [None] * len(datas)
+    errors = []
+
+    valid = []
+
+    for idx, data in enumerate(datas):
+        encoded, error = meta.check(data)
+
+        if error:
+            errors.append((offset + idx, error))
+        else:
+            valid.append((idx, encoded))
+
+    try:
+        decoded, bad = meta.decode_valid([encoded for idx, encoded in valid])
+    except Exception as e:
+        logr.warning(f"⚠️ {meta.name} payload passed the checks but didn't decode ({type(e).__name__}: {e}), decoding row by row")
+        decoded, bad = decode_rows(meta, [encoded for idx, encoded in valid])
+
+    for (idx, encoded), result in zip(valid, decoded):
+        results[idx] = result
+
+    errors.extend((offset + valid[i][0], error) for i, error in bad)
+
+    return results, sorted(errors)
+
+def decode_rows(meta, encodeds):
+    """decode_valid() one payload at a time, with (index, error) for the ones that raise."""
+
+    decoded = []
+    bad = []
+
+    for idx, encoded in enumerate(encodeds):
+        try:
+            results, errors = meta.decode_valid([encoded])
+        except Exception as e:
+            results, errors = [None], [(0, f"{type(e).__name__}: {e}")]
+
+        decoded.extend(results)
+        bad.extend((idx, error) for _, error in errors)
+
+    return decoded, bad
 
 class AttestionMeta:
     def __init__(self, schema_id, **kwtypes):
@@ -10,24 +200,81 @@ class AttestionMeta:
     @property
     def name(self):
         return self.__class__.__name__
-    
-    def decode(self, data):
-        types = list(self.kwtypes.values())
-        encoded = bytes.fromhex(data.replace("0x", ""))
-        result = decode(types, encoded)
-        result = {k: v for k, v in zip(self.kwtypes.keys(), result)}
+
+    def check(self, data):
+        """(payload bytes, None), or (None, why the payload won't decode)."""
+
+        if not isinstance(data, str) or not HEX.fullmatch(data):
+            return None, "Not a hex string"
+
+        encoded = bytes.fromhex(data[2:] if data.startswith('0x') else data)
+
+        return encoded, check_items(parsed_types(tuple(self.kwtypes.values())), encoded, 0)
+
+    def decode_valid(self, encodeds):
+        """
+        Decode payloads that passed `check`, with the schema's precompiled decoder.
+
+        Returns `(results, errors)` like decode_chunk, for any schema-level checks after the ABI
+        decode (eg. a Vote's params).
+        """
+
+        decoder = tuple_decoder(tuple(self.kwtypes.values()))
 
         def bytes_to_str(x):
             if isinstance(x, bytes):
                 return x.hex()
             return x
 
-        result = {k : bytes_to_str(v) for k, v in result.items()}
+        results = [{k: bytes_to_str(v) for k, v in zip(self.kwtypes.keys(), decoder(ContextFramesBytesIO(encoded)))} for encoded in encodeds]
+
+        return results, []
+
+    def decode(self, data):
+
+        results, errors = decode_chunk(self, [data])
+
+        if errors:
+            raise ValueError(errors[0][1])
+
+        return results[0]
+
+    def decode_batch(self, datas, processes=None):
+        """
+        Decode many hex payloads for this schema at once.
+
+        Returns `(results, errors)`: `results` lines up with `datas`, with None where a payload didn't
+        decode, and `errors` lists `(index, message)` for those.  With more than one process (or
+        `S8_DECODE_PROCESSES`) and enough rows, chunks are decoded in a process pool.
+        """
+
+        processes = min(resolve_decode_processes(processes), max(1, len(datas) // MIN_ROWS_PER_PROCESS))
+
+        if processes == 1:
+            return decode_chunk(self, datas)
+
+        size = -(-len(datas) // processes)
+        offsets = list(range(0, len(datas), size))
+
+        results = []
+        errors = []
+
+        # Schemas are decoded from several download threads, and forking a threaded process can
+        # copy a lock another thread is holding, so the workers come from a forkserver instead.
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('forkserver')) as executor:
+            for chunk_results, chunk_errors in executor.map(decode_chunk, [self] * len(offsets), [datas[o:o + size] for o in offsets], offsets):
+                results.extend(chunk_results)
+                errors.extend(chunk_errors)
 
-        return result
+        return results, errors
 
 bytes32 = bytes
 
+# A JSON list of integers, bare or as strings, eg. [1, 2] or ["1", "2"]: what nearly every Vote's
+# params look like, and what can be parsed for a whole batch with one json.loads.
+PARAMS_ITEM = r'[ \t\n\r]*(-?(0|[1-9][0-9]*)|" *[-+]?[0-9]+ *")[ \t\n\r]*'
+PARAMS = re.compile(rf'[ \t\n\r]*\[({PARAMS_ITEM}(,{PARAMS_ITEM})*|[ \t\n\r]*)\][ \t\n\r]*')
+
 class Citizens(AttestionMeta):
     def __init__(self, schema_id):
         super().__init__(schema_id, FarcaserId="uint256", SelectionMethod="string")
@@ -40,10 +287,36 @@ class Vote(AttestionMeta):
     def __init__(self, schema_id):
         super().__init__(schema_id, proposalId="uint256", params="string")
     
-    def decode(self, data):
-        result = super().decode(data)
-        result['params'] =  [int(x) for x in json.loads(result['params'])]
-        return result
+    def decode_valid(self, encodeds):
+
+        results, errors = super().decode_valid(encodeds)
+
+        plain = [PARAMS.fullmatch(result['params']) is not None for result in results]
+
+        # The plain ones parsed in one go.
+        batch = [result for result, is_plain in zip(results, plain) if is_plain]
+        params = json.loads('[' + ','.join(result['params'] for result in batch) + ']')
+
+        for result, row_params in zip(batch, params):
+            result['params'] = [int(x) for x in row_params]
+
+        # Anything else is parsed as it always was, so eg. [1.0] or [" +1 "] are still accepted.
+        for idx, (result, is_plain) in enumerate(zip(results, plain)):
+
+            if is_plain:
+                continue
+
+            try:
+                result['params'] = [int(x) for x in json.loads(result['params'])]
+            except Exception as e:
+                errors.append((idx, f"Bad params {result['params']!r}: {type(e).__name__}: {e}"))
+                results[idx] = None
+
+        return results, errors
+
+    def data_prefix(self, proposal_id):
+        # proposalId is the first, static, field, so it's always the first word of the encoded data.
+        return '0x' + encode(['uint256'], [int(proposal_id)]).hex()
 
 class CreateProposal(AttestionMeta):
     def __init__(self, schema_id):
@@ -0,0 +1,38 @@
+import numpy as np
+
+# Vote weights are uint256 token amounts, too big for any numpy dtype.  So each one is split into
+# eight 32 bit limbs, held in uint64 columns: adding up to 2**32 of them can't overflow a column,
+# so a plain (vectorized) sum per column is exact, and the carries are settled once at the end.
+LIMB_BITS = 32
+LIMB_COUNT = 8
+LIMB_COLUMNS = [f'weight_limb{i}' for i in range(LIMB_COUNT)]
+
+def to_limbs(values):
+    """uint256s (ints, or the decimal strings the stores hand back) as an (n, 8) array of limbs, least significant first."""
+
+    encoded = b''.join(int(value).to_bytes(32, 'little') for value in values)
+
+    return np.frombuffer(encoded, dtype='<u4').reshape(-1, LIMB_COUNT).astype(np.uint64)
+
+def from_limbs(limbs):
+    return sum(int(limb) << (LIMB_BITS * i) for i, limb in enumerate(limbs))
+
+def add_weight_limbs(df, column='weight'):
+    """Add the LIMB_COLUMNS for `column` to `df`, done once when votes are loaded."""
+
+    limbs = to_limbs(df[column])
+
+    for i, limb_column in enumerate(LIMB_COLUMNS):
+        df[limb_column] = limbs[:, i]
+
+    return df
+
+def weight_sum(df):
+    return from_limbs(df[LIMB_COLUMNS].to_numpy().sum(axis=0))
+
+def weight_sums(df, by):
+    """Exact sum of the weights per group, as {group: int}."""
+
+    sums = df.groupby(by)[LIMB_COLUMNS].sum()
+
+    return {key: from_limbs(limbs) for key, limbs in zip(sums.index, sums.to_numpy())}
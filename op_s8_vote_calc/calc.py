@@ -4,7 +4,10 @@ from pathlib import Path
 from yaml import load, FullLoader
 from pprint import pprint
 import json
+import io
 from copy import deepcopy
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 
 from .jsonrpc_client import JsonRpcHistHttpClient
 from .graphqleas_client import EASGraphQLClient
@@ -23,15 +26,61 @@ from .calc_optimistic import FinalOptimisticTally, OffChainOptimisticMixin, OnCh
 from .signatures import *
 
 from .attestations import meta as all_meta
+from .store import open_store
+from .loader import DataLoader, index_by, take
+from .bigint import LIMB_COLUMNS, add_weight_limbs, weight_sums
 
 import pandas as pd
 
 DATA_DIR = Path(os.getenv('S8_DATA_DIR', 'op_s8_vote_calc/data'))
 DEPLOYMENT = os.getenv('S8_DEPLOYMENT', 'test')
 
+store = open_store(DATA_DIR / DEPLOYMENT)
+loader = DataLoader(store)
+
 onchain_config, offchain_config = load_config()
 PTC_MODULES = {v['address'] : v['name'] for v in onchain_config['gov']['modules']}
 
+ONCHAIN_VOTE_COLUMNS = ['voter', 'proposal_id', 'support', 'weight']
+OFFCHAIN_VOTE_COLUMNS = ['proposalId', 'refUID', 'params']
+CITIZEN_COLUMNS = ['id', 'revoked', 'SelectionMethod']
+
+def resolve_calc_processes(processes=None):
+
+    try:
+        processes = int(processes or os.getenv('S8_CALC_PROCESSES', 1))
+        assert processes > 0
+    except:
+        processes = 1
+
+    return processes
+
+def compliant_citizens(citizens):
+    """Citizens with a compliant attestation, with their SelectionMethod as 'chain', 'app' or 'user'."""
+
+    citizens = citizens.copy()
+
+    citizens['SelectionMethod'] = citizens['SelectionMethod'].astype(str)
+
+    # Filter out non-compliant attestations.
+    citizens = citizens[citizens['SelectionMethod'].isin(['5.1', '5.2', '5.3'])]
+    citizens['SelectionMethod'] = citizens['SelectionMethod'].map({'5.1': 'chain', '5.2': 'app', '5.3': 'user'})
+
+    return citizens
+
+def check_citizens(citizens):
+    """Every compliant citizen attested once, checked over the whole Citizens table, as it always was."""
+
+    if citizens.duplicated(subset=['id']).any():
+        raise ValueError("Duplicates found in citizens.id.")
+
+def join_citizens(votes, citizens):
+    """Votes cast by live citizens, with their SelectionMethod; `citizens` come from compliant_citizens()."""
+
+    votes = votes[votes['refUID'].isin(citizens[~citizens['revoked'].astype(bool)]['id'])]
+
+    return votes.merge(citizens, left_on='refUID', right_on='id', how='inner', validate='many_to_one')
+
 class Proposal:
 
     @property
@@ -113,24 +162,29 @@ class OffChain(Proposal, OffChainBasicMixin, OffChainApprovalMixin, OffChainOpti
 
 
 
-    def load_context(self):
+    def load_context(self, groups=None):
 
         # Assumed hard-coded for now.
         self.ch_counts = {'app' : 100, 'user': 1000, 'chain' : 15}
 
         self.voto_levels = self.proposal_type_info['tiers']
 
-        citizens = pd.read_csv(DATA_DIR / DEPLOYMENT / "Citizens.csv")
+        if groups is None:
+            votes = loader.select('Vote', 'proposalId', self.offchain_proposal_id, columns=['proposalId', 'refUID', 'params'])
 
-        citizens['SelectionMethod'] = citizens['SelectionMethod'].astype(str)
+            check_citizens(compliant_citizens(read_or_empty('Citizens', CITIZEN_COLUMNS)))
 
-        # Filter out non-compliant attestations.
-        citizens = citizens[citizens['SelectionMethod'].isin(['5.1', '5.2', '5.3'])]
-        citizens['SelectionMethod'] = citizens['SelectionMethod'].map({'5.1': 'chain', '5.2': 'app', '5.3': 'user'})
- 
-        df = pd.read_csv(DATA_DIR / DEPLOYMENT / 'Vote.csv')
+            # Only the citizens behind this proposal's votes are joined.
+            citizens = compliant_citizens(loader.select('Citizens', 'id', list(votes['refUID'].unique()), columns=['id', 'revoked', 'SelectionMethod']))
 
-        offc_votes = df[df['proposalId'] == self.offchain_proposal_id].copy()
+            offc_votes = join_citizens(votes, citizens)
+        else:
+            offc_votes = groups.offchain_votes(self.offchain_proposal_id)
+
+        if offc_votes.duplicated(subset=['refUID']).any():
+            raise ValueError("Duplicates found in offc_votes.refUID.")
+
+        offc_votes = offc_votes.copy()
 
         if self.proposal_type_label in ['basic', 'optimistic']:
             offc_votes['support'] = offc_votes['params'].apply(lambda x: json.loads(x)[0])
@@ -141,19 +195,12 @@ class OffChain(Proposal, OffChainBasicMixin, OffChainApprovalMixin, OffChainOpti
             offc_votes['weight'] = 1
             cols = ['SelectionMethod', 'choices', 'weight']
 
-        offc_votes = offc_votes[offc_votes['refUID'].isin(citizens[~citizens['revoked']]['id'])].copy()
-
-        if offc_votes.duplicated(subset=['refUID']).any():
-            raise ValueError("Duplicates found in offc_votes.refUID.")
-
-        if citizens.duplicated(subset=['id']).any():
-            raise ValueError("Duplicates found in citizens.id.")
-
-        offc_votes_with_citizens = offc_votes.merge(citizens, left_on='refUID', right_on='id', how='inner', validate='one_to_one')
-
-        offc_votes_with_citizens = offc_votes_with_citizens[cols].copy()
+        self.offc_votes = offc_votes[cols].copy()
 
-        self.offc_votes = offc_votes_with_citizens        
+        if groups is not None and self.proposal_type_label in ['basic', 'optimistic']:
+            self.category_counts = groups.category_counts(self.offchain_proposal_id)
+        elif self.proposal_type_label in ['basic', 'optimistic']:
+            self.category_counts = self.offc_votes.groupby(['SelectionMethod', 'support'])['weight'].sum()
 
     def show_result(self):
 
@@ -211,14 +258,18 @@ class OnChain(Proposal, OnChainBasicMixin, OnChainApprovalMixin, OnChainOptimist
             self.decoded_proposal_data_choices, self.decoded_proposal_data_settings = None, None
 
 
-    def load_context(self):
+    def load_context(self, groups=None):
 
-        df1 = pd.read_csv(DATA_DIR / DEPLOYMENT / 'VoteCast(address,uint256,uint8,uint256,string).csv')
-        df2 = pd.read_csv(DATA_DIR / DEPLOYMENT / 'VoteCastWithParams(address,uint256,uint8,uint256,string,bytes).csv')
-        df = pd.concat([df1, df2])
-        df = df[df['proposal_id'] == self.onchain_proposal_id]
+        if groups is None:
+            df1 = loader.select(VOTE_CAST_1, 'proposal_id', self.onchain_proposal_id, columns=ONCHAIN_VOTE_COLUMNS)
+            df2 = loader.select(VOTE_CAST_WITH_PARAMS_1, 'proposal_id', self.onchain_proposal_id, columns=ONCHAIN_VOTE_COLUMNS + ['params'])
+            df = pd.concat([df1, df2])
 
-        self.onc_votes = df
+            self.onc_votes = add_weight_limbs(df)
+            self.support_vp = weight_sums(self.onc_votes, 'support')
+        else:
+            self.onc_votes = groups.onchain_votes(self.onchain_proposal_id)
+            self.support_vp = groups.support_vp.get(self.onchain_proposal_id, {})
 
     def show_result(self):
 
@@ -336,17 +387,22 @@ class Hybrid(Proposal):
             final_tally = FinalOptimisticTally(tallies, weights = weights, against_thresh_tiers=self.off_chain_p.voto_levels)
             print(final_tally.gen_tally_report("Final"))
     
-    def load_context(self):
+    def load_context(self, groups=None):
 
-        self.off_chain_p.load_context()
-        self.on_chain_p.load_context()
+        self.off_chain_p.load_context(groups)
+        self.on_chain_p.load_context(groups)
 
 class ProposalLister:
-    def __init__(self, on_chain_props_df, off_chain_props_df):
+    """
+    Every proposal, indexed by id.
 
-        off_chain = []
-        on_chain = []
-        hybrid = []
+    Only the rows are sorted out up front; each OffChain / OnChain / Hybrid (which reads its meta
+    JSON) is built the first time it's asked for, so `get_proposal` touches just the one proposal.
+    An on-chain proposal that an off-chain one points at is part of that Hybrid, and is only listed
+    on its own if the Hybrid can't be built.
+    """
+
+    def __init__(self, on_chain_props_df, off_chain_props_df):
 
         offchain_only = off_chain_props_df[off_chain_props_df['onchain_proposalid'] == '0']
 
@@ -354,33 +410,73 @@ class ProposalLister:
         offchain_with_onchain = off_chain_props_df[off_chain_props_df['onchain_proposalid'] != '0']
         offchain_with_onchain = offchain_with_onchain.drop_duplicates('onchain_proposalid', keep='last')
 
-        off_chain_props_df = pd.concat([offchain_only, offchain_with_onchain])
+        on_chain_rows = {}
+        for idx, row in on_chain_props_df.iterrows():
+            on_chain_rows.setdefault(row['proposal_id'], row)
+
+        # kind -> [(proposal id, class, rows, id of the Hybrid that takes it over)]
+        self.entries = {'off_chain': [], 'on_chain': [], 'hybrid': []}
+        self.index = {}
+        self.built = {}
+
+        for idx, row in offchain_only.iterrows():
+            self.add('off_chain', row['proposalId'], OffChain, (row,))
+
+        claimed = {}
+
+        for idx, row in offchain_with_onchain.iterrows():
+            on_chain_row = on_chain_rows.get(row['onchain_proposalid'])
+
+            if on_chain_row is None:
+                print(f"Warning: Onchain Proposal ID# {row['onchain_proposalid']} not found, but mentioned in OffChain Prop ID {row['proposalId']}")
+            else:
+                hybrid_id = f"{on_chain_row['proposal_id']}-{row['proposalId']}"
+                claimed[row['onchain_proposalid']] = hybrid_id
+                self.add('hybrid', hybrid_id, Hybrid, (row, on_chain_row))
+
+        for idx, row in on_chain_props_df.iterrows():
+            self.add('on_chain', row['proposal_id'], OnChain, (row,), claimed.get(row['proposal_id']))
+
+    def add(self, kind, proposal_id, cls, rows, claimed_by=None):
+
+        # get_proposal used to scan off-chain, then on-chain, then hybrid; the first match wins.
+        self.entries[kind].append((proposal_id, cls, rows, claimed_by))
+        self.index.setdefault(proposal_id, []).append((kind, len(self.entries[kind]) - 1))
+
+    def build(self, kind, position):
+        """The Proposal for an entry, or None if it can't be built (or is part of a Hybrid)."""
+
+        key = (kind, position)
 
-        for idx, row in off_chain_props_df.iterrows():
-            if row['onchain_proposalid'] == '0':
+        if key not in self.built:
+            proposal_id, cls, rows, claimed_by = self.entries[kind][position]
+
+            if claimed_by is not None and self.build(*self.index[claimed_by][0]) is not None:
+                self.built[key] = None
+            else:
                 try:
-                    off_chain.append(OffChain(row))
+                    self.built[key] = cls(*rows)
                 except NotImplementedError as e:
                     print(f"Warning: {e}")
-            else:
-                on_chain_prop = on_chain_props_df[on_chain_props_df['proposal_id'] == row['onchain_proposalid']]
+                    self.built[key] = None
 
-                if on_chain_prop.empty:
-                    print(f"Warning: Onchain Proposal ID# {row['onchain_proposalid']} not found, but mentioned in OffChain Prop ID {row['proposalId']}")
-                else:
-                    try:
-                        hybrid.append(Hybrid(row, on_chain_prop.iloc[0]))
-                        on_chain_props_df = on_chain_props_df[on_chain_props_df['proposal_id'] != row['onchain_proposalid']]
-                    except NotImplementedError as e:
-                        print(f"Warning: {e}")
+        return self.built[key]
 
+    def proposals(self, kind):
+        built = [self.build(kind, position) for position in range(len(self.entries[kind]))]
+        return [prop for prop in built if prop is not None]
 
-        for idx, row in on_chain_props_df.iterrows():
-            on_chain.append(OnChain(row))
+    @property
+    def off_chain(self):
+        return self.proposals('off_chain')
+
+    @property
+    def on_chain(self):
+        return self.proposals('on_chain')
 
-        self.off_chain = off_chain
-        self.on_chain = on_chain
-        self.hybrid = hybrid
+    @property
+    def hybrid(self):
+        return self.proposals('hybrid')
 
     @staticmethod
     def load():
@@ -392,14 +488,11 @@ class ProposalLister:
 
     
     def get_proposal(self, proposal_id):
-        for prop in self.off_chain:
-            if prop.id == proposal_id:
-                return prop
-        for prop in self.on_chain:
-            if prop.id == proposal_id:
-                return prop
-        for prop in self.hybrid:
-            if prop.id == proposal_id:
+        kind_order = ['off_chain', 'on_chain', 'hybrid']
+
+        for kind, position in sorted(self.index.get(proposal_id, []), key=lambda entry: kind_order.index(entry[0])):
+            prop = self.build(kind, position)
+            if prop is not None:
                 return prop
         raise Exception(f"Proposal {proposal_id} not found")
 
@@ -425,24 +518,173 @@ class ProposalLister:
 def load_proposal_data():
 
     try:    
-        df_onc1 = pd.read_csv(DATA_DIR / DEPLOYMENT / (PROPOSAL_CREATED_2 + '.csv'))
+        df_onc1 = loader.read(PROPOSAL_CREATED_2)
     except FileNotFoundError:
         df_onc1 = pd.DataFrame()
     
     try:    
-        df_onc2 = pd.read_csv(DATA_DIR / DEPLOYMENT / (PROPOSAL_CREATED_4 + '.csv'))
+        df_onc2 = loader.read(PROPOSAL_CREATED_4)
     except FileNotFoundError:
         df_onc2 = pd.DataFrame()
     
     df_onc = pd.concat([df_onc1, df_onc2])
 
     try:    
-        df_off = pd.read_csv(DATA_DIR / DEPLOYMENT / "CreateProposal.csv").drop_duplicates(['id'], keep='last')
+        df_off = loader.read('CreateProposal').drop_duplicates(['id'], keep='last')
     except FileNotFoundError:
         df_off = pd.DataFrame()
 
     return df_onc, df_off
 
+def read_or_empty(name, columns):
+
+    try:
+        return loader.read(name)[columns]
+    except FileNotFoundError:
+        return pd.DataFrame(columns=columns)
+
+class VoteGroups:
+    """
+    Every proposal's votes, loaded and grouped in one pass, for calculating many proposals at once.
+
+    Both VoteCast tables are read, converted to weight limbs and summed per (proposal_id, support)
+    in one go; off-chain votes are joined to the citizens once, and counted per (proposalId,
+    SelectionMethod, support).  Each proposal then just picks its groups, and its slice of votes
+    for the tallies that need the individual ballots (approval).
+    """
+
+    def __init__(self):
+
+        onc_votes = pd.concat([read_or_empty(VOTE_CAST_1, ONCHAIN_VOTE_COLUMNS),
+                               read_or_empty(VOTE_CAST_WITH_PARAMS_1, ONCHAIN_VOTE_COLUMNS + ['params'])])
+
+        self.onc_votes, self.onc_bounds = index_by(add_weight_limbs(onc_votes.reset_index(drop=True)), 'proposal_id')
+
+        self.support_vp = defaultdict(dict)
+        for (proposal_id, support), vp in weight_sums(self.onc_votes, ['proposal_id', 'support']).items():
+            self.support_vp[proposal_id][support] = vp
+
+        votes = read_or_empty('Vote', OFFCHAIN_VOTE_COLUMNS)
+        citizens = compliant_citizens(read_or_empty('Citizens', CITIZEN_COLUMNS))
+
+        # check_citizens(), but raised by every proposal with off-chain votes (as it would be on
+        # its own) rather than here, so the on-chain ones are still counted.
+        self.duplicate_citizens = bool(citizens.duplicated(subset=['id']).any())
+
+        offc_votes = join_citizens(votes, citizens.drop_duplicates(subset=['id']))
+
+        self.offc_votes, self.offc_bounds = index_by(offc_votes, 'proposalId')
+
+        # For basic and optimistic proposals, the first param is the support.
+        ballots = self.offc_votes[['proposalId', 'SelectionMethod']].copy()
+        ballots['support'] = self.offc_votes['params'].apply(lambda x: (json.loads(x) or [None])[0])
+        ballots['weight'] = 1
+
+        self.counts = ballots.groupby(['proposalId', 'SelectionMethod', 'support'])['weight'].sum()
+
+    def onchain_votes(self, proposal_id):
+        return take(self.onc_votes, self.onc_bounds, proposal_id)
+
+    def offchain_votes(self, proposal_id):
+
+        if self.duplicate_citizens:
+            raise ValueError("Duplicates found in citizens.id.")
+
+        return take(self.offc_votes, self.offc_bounds, proposal_id)
+
+    def category_counts(self, proposal_id):
+
+        if proposal_id in self.offc_bounds:
+            return self.counts.xs(proposal_id, level='proposalId')
+
+        empty = pd.Series(dtype='int64', name='weight')
+        return empty.set_axis(pd.MultiIndex.from_arrays([[], []], names=['SelectionMethod', 'support']))
+
+
+class ProposalVotes:
+    """
+    One proposal's slice of a VoteGroups, as plain columns, to hand to a worker process.
+
+    Only the columns the tallies read are kept (eg. weight limbs, not the uint256 strings), as numpy
+    arrays, so what gets pickled is a few flat arrays per proposal rather than DataFrames or the
+    whole VoteGroups.  It answers the same calls as VoteGroups, for that one proposal.
+    """
+
+    ONCHAIN_COLUMNS = ['support', 'params'] + LIMB_COLUMNS
+    OFFCHAIN_COLUMNS = ['refUID', 'params', 'SelectionMethod']
+
+    def __init__(self, groups, prop):
+
+        self.onchain_proposal_id = getattr(prop, 'onchain_proposal_id', None)
+        self.offchain_proposal_id = getattr(prop, 'offchain_proposal_id', None)
+
+        self.onc_votes, self.support_vp, self.offc_votes, self.counts = None, {}, None, {}
+
+        # Left for the worker to raise, as offchain_votes() would have.
+        self.duplicate_citizens = groups.duplicate_citizens
+
+        if self.onchain_proposal_id is not None:
+            votes = groups.onchain_votes(self.onchain_proposal_id)
+            self.onc_votes = {column: votes[column].to_numpy() for column in self.ONCHAIN_COLUMNS}
+            self.support_vp = {self.onchain_proposal_id: groups.support_vp.get(self.onchain_proposal_id, {})}
+
+        if self.offchain_proposal_id is not None and not self.duplicate_citizens:
+            votes = groups.offchain_votes(self.offchain_proposal_id)
+            self.offc_votes = {column: votes[column].to_numpy() for column in self.OFFCHAIN_COLUMNS}
+            self.counts = groups.category_counts(self.offchain_proposal_id).to_dict()
+
+    def onchain_votes(self, proposal_id):
+        assert proposal_id == self.onchain_proposal_id
+        return pd.DataFrame(self.onc_votes)
+
+    def offchain_votes(self, proposal_id):
+        assert proposal_id == self.offchain_proposal_id
+
+        if self.duplicate_citizens:
+            raise ValueError("Duplicates found in citizens.id.")
+
+        return pd.DataFrame(self.offc_votes)
+
+    def category_counts(self, proposal_id):
+        assert proposal_id == self.offchain_proposal_id
+
+        index = pd.MultiIndex.from_tuples(list(self.counts), names=['SelectionMethod', 'support']) if self.counts else \
+                pd.MultiIndex.from_arrays([[], []], names=['SelectionMethod', 'support'])
+
+        return pd.Series(list(self.counts.values()), index=index, dtype='int64', name='weight')
+
+def report_proposal(prop, groups):
+    """(proposal id, report, error) for one proposal; the report is what show_result printed."""
+
+    report = io.StringIO()
+
+    try:
+        with redirect_stdout(report):
+            prop.load_context(groups)
+            prop.show_result()
+    except Exception as e:
+        return prop.id, report.getvalue(), f"{type(e).__name__}: {e}"
+
+    return prop.id, report.getvalue(), None
+
+def tally_proposals(props, groups, processes=None):
+    """
+    report_proposal() for every proposal, in the order given.
+
+    With more than one process, the proposals are spread over a pool of worker processes, each sent
+    just the proposal and its ProposalVotes; results still come back in the order given.
+    """
+
+    processes = min(resolve_calc_processes(processes), len(props))
+
+    if processes <= 1:
+        for prop in props:
+            yield report_proposal(prop, groups)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield from executor.map(report_proposal, props, [ProposalVotes(groups, prop) for prop in props])
+
 if __name__ == '__main__':
     cli()
 
@@ -24,6 +24,8 @@ from .attestations import meta as all_meta
 import pandas as pd
 import numpy as np
 
+from .bigint import LIMB_COLUMNS, weight_sums
+
 DATA_DIR = Path(os.getenv('S8_DATA_DIR', 'op_s8_vote_calc/data'))
 DEPLOYMENT = os.getenv('S8_DEPLOYMENT', 'test')
 
@@ -212,23 +214,16 @@ class OnChainApprovalMixin:
             for support in [0, 1, 2]:
                 blank_counts[choice_pos][support] = 0
 
-        def bigint_sum(arr):
-            ans = 0
-            for val in arr.values:
-                ans += int(val[0])
-            return str(ans)
-
-        ballot_feed = onc_votes[['support', 'weight', 'params']].explode('params')
+        # pandas doesn't play nice with large ints, so the weights are summed as limbs (see bigint.py).
+        ballot_feed = onc_votes[['support', 'params'] + LIMB_COLUMNS].explode('params')
 
-        counts = ballot_feed.groupby(['params', 'support']).apply(bigint_sum, include_groups=False)
-        totals = ballot_feed.groupby(['params'])['weight'].apply(bigint_sum).to_dict()
+        counts = weight_sums(ballot_feed, ['params', 'support'])
+        totals = weight_sums(ballot_feed, 'params')
     
-        # pandas doesn't play nice with large ints.
-        aggregated_support_vp = onc_votes[['support', 'weight']].groupby('support').apply(bigint_sum, include_groups=False).to_dict()
-        aggregated_support_vp = { k : int(v) for k, v in aggregated_support_vp.items()}
+        aggregated_support_vp = dict(self.support_vp)
 
         for (param, support), value in counts.items():
-            blank_counts[param][support] = value
+            blank_counts[param][support] = str(value)
         counts = dict(blank_counts)
 
         """
@@ -177,10 +177,7 @@ class OffChainBasicMixin:
         
         assert self.proposal_type_label == 'basic', f"Proposal type is not basic: {self.proposal_type_label}"
 
-        def bigint_sum(arr):
-            return str(sum([int(o) for o in arr.values]))
-
-        counts = self.offc_votes.groupby(['SelectionMethod', 'support'])['weight'].sum()
+        counts = self.category_counts
         
         empty = pd.Series(dtype='int64', name='weight')
         empty.index.name = 'support'
@@ -206,10 +203,7 @@ class OnChainBasicMixin:
         
         assert self.proposal_type_label == 'basic', f"Proposal type is not basic: {self.proposal_type_label}"
 
-        def bigint_sum(arr):
-            return str(sum([int(o) for o in arr.values]))
-    
-        counts = self.onc_votes.groupby('support')['weight'].apply(bigint_sum).to_dict()
+        counts = self.support_vp
         against_votes = int(counts.get(0, 0))
         for_votes = int(counts.get(1, 0))
         abstain_votes = int(counts.get(2, 0))
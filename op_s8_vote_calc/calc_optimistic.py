@@ -206,10 +206,7 @@ class OffChainOptimisticMixin:
 
         tiers = self.proposal_type_info['tiers']
 
-        def bigint_sum(arr):
-            return str(sum([int(o) for o in arr.values]))
-
-        counts = self.offc_votes.groupby(['SelectionMethod', 'support'])['weight'].sum()
+        counts = self.category_counts
         
         empty = pd.Series(dtype='int64', name='weight')
         empty.index.name = 'support'
@@ -234,10 +231,7 @@ class OnChainOptimisticMixin:
 
         assert self.proposal_type_label == 'optimistic', f"Proposal type is not optimistic: {self.proposal_type_label}"
 
-        def bigint_sum(arr):
-            return str(sum([int(o) for o in arr.values]))
-    
-        counts = self.onc_votes.groupby('support')['weight'].apply(bigint_sum).to_dict()
+        counts = self.support_vp
         against_votes = int(counts.get(0, 0))
         abstain_votes = int(counts.get(2, 0))
 
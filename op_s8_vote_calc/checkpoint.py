@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def merge_ranges(ranges):
+    """Collapse inclusive [from_block, to_block] ranges into a sorted list of disjoint ones."""
+
+    merged = []
+
+    for from_block, to_block in sorted(ranges):
+        if merged and from_block <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], to_block)
+        else:
+            merged.append([from_block, to_block])
+
+    return merged
+
+def subtract_ranges(from_block, to_block, covered):
+    """Inclusive ranges inside [from_block, to_block] that are not in `covered`."""
+
+    gaps = []
+
+    for covered_from, covered_to in merge_ranges(covered):
+        if covered_to < from_block:
+            continue
+        if covered_from > to_block:
+            break
+        if covered_from > from_block:
+            gaps.append([from_block, covered_from - 1])
+        from_block = max(from_block, covered_to + 1)
+
+    if from_block <= to_block:
+        gaps.append([from_block, to_block])
+
+    return gaps
+
+
+class CoverageCheckpoint:
+    """
+    Block ranges already downloaded, per chain / address / topic.
+
+    Persisted as JSON next to the CSVs it describes, eg...
+
+    {"10": {"0xcdf27f107725988f2261ce2256bdfcde8b382b10": {"0xb8e138...": [[137682723, 140678425]]}}}
+    """
+
+    def __init__(self, fname):
+        self.fname = Path(fname)
+
+        if self.fname.exists():
+            with open(self.fname, 'r') as f:
+                self.coverage = json.load(f)
+        else:
+            self.coverage = {}
+
+    def ranges(self, chain_id, address, topic):
+        return self.coverage.get(str(chain_id), {}).get(address.lower(), {}).get(topic, [])
+
+    def gaps(self, chain_id, address, topic, from_block, to_block):
+        return subtract_ranges(from_block, to_block, self.ranges(chain_id, address, topic))
+
+    def is_covered(self, chain_id, address, topic, block_number):
+        return any(from_block <= block_number <= to_block for from_block, to_block in self.ranges(chain_id, address, topic))
+
+    def add(self, chain_id, address, topic, from_block, to_block):
+
+        topics = self.coverage.setdefault(str(chain_id), {}).setdefault(address.lower(), {})
+        topics[topic] = merge_ranges(topics.get(topic, []) + [[from_block, to_block]])
+
+    def truncate(self, chain_id, address, topic, to_block):
+        """Forget coverage past `to_block`, eg. for blocks a reorg orphaned."""
+
+        topics = self.coverage.get(str(chain_id), {}).get(address.lower(), {})
+
+        if topic in topics:
+            topics[topic] = [[from_block, min(covered_to, to_block)] for from_block, covered_to in topics[topic] if from_block <= to_block]
+
+    def reset(self, chain_id, address, topic):
+        self.coverage.get(str(chain_id), {}).get(address.lower(), {}).pop(topic, None)
+
+    def save(self):
+
+        self.fname.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = self.fname.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.coverage, f, indent=2)
+        os.replace(tmp, self.fname)
+
+
+def resolve_watermark_lookback():
+
+    try:
+        lookback = int(os.getenv('S8_EAS_WATERMARK_LOOKBACK', 3600))
+        assert lookback >= 0
+    except:
+        lookback = 3600
+
+    return lookback
+
+
+class AttestationWatermark:
+    """
+    Newest `timeCreated` and `revocationTime` seen per EAS schema, so the next sync only asks for what changed.
+
+    Persisted as JSON next to the CSVs, eg...
+
+    {"0xec3674d9...": {"time_created": 1738000000, "revocation_time": 1738001234}}
+
+    `since()` hands the watermark back with `lookback` seconds of overlap, in case the indexer
+    stores an attestation a little after its timestamp; re-fetched rows are merged by id.
+    """
+
+    def __init__(self, fname, lookback=None):
+        self.fname = Path(fname)
+        self.lookback = resolve_watermark_lookback() if lookback is None else lookback
+        self.lock = threading.Lock()
+
+        if self.fname.exists():
+            with open(self.fname, 'r') as f:
+                self.watermarks = json.load(f)
+        else:
+            self.watermarks = {}
+
+    def since(self, schema_id):
+
+        if schema_id not in self.watermarks:
+            return None
+
+        watermark = self.watermarks[schema_id]
+
+        # revocationTime is 0 for live attestations, so never let that bound reach 0.
+        return max(watermark['time_created'] - self.lookback, 0), max(watermark['revocation_time'] - self.lookback, 1)
+
+    def advance(self, schema_id, attestations):
+
+        time_created = max([int(attestation['timeCreated']) for attestation in attestations], default=0)
+        revocation_time = max([int(attestation['revocationTime']) for attestation in attestations], default=0)
+
+        with self.lock:
+            watermark = self.watermarks.setdefault(schema_id, {'time_created': 0, 'revocation_time': 0})
+            watermark['time_created'] = max(watermark['time_created'], time_created)
+            watermark['revocation_time'] = max(watermark['revocation_time'], revocation_time)
+
+    def reset(self, schema_id):
+        with self.lock:
+            self.watermarks.pop(schema_id, None)
+
+    def save(self):
+
+        self.fname.parent.mkdir(parents=True, exist_ok=True)
+
+        # Schemas are synced from several threads, so only one of them writes the file at a time.
+        with self.lock:
+            tmp = self.fname.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self.watermarks, f, indent=2)
+            os.replace(tmp, self.fname)
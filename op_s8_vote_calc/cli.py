@@ -1,4 +1,5 @@
 import argh
+import asyncio
 import csv, os
 from pathlib import Path
 from yaml import load, FullLoader
@@ -6,10 +7,11 @@ from pprint import pprint
 import json
 from copy import deepcopy
 
-from .jsonrpc_client import JsonRpcHistHttpClient
+from .jsonrpc_client import JsonRpcHistHttpClient, JsonRpcHistAsyncHttpClient
 from .graphqleas_client import EASGraphQLClient
 from web3 import Web3
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from eth_abi import decode
 
@@ -19,6 +21,10 @@ from .utils import camel_to_snake, load_config, get_web3
 from .signatures import *
 from .calc import *
 from .jsonrpc_client import JsonRpcContractCalls
+from .checkpoint import CoverageCheckpoint, AttestationWatermark, merge_ranges
+from .logcache import LogCache
+from .follow import HeadFollower
+from .store import open_store, signature_types
 
 from .attestations import meta as all_meta
 
@@ -27,9 +33,16 @@ import pandas as pd
 DATA_DIR = Path(os.getenv('S8_DATA_DIR', 'op_s8_vote_calc/data'))
 ABIS_DIR = Path(os.getenv('S8_ABIS_DIR', 'op_s8_vote_calc/abis'))
 DEPLOYMENT = os.getenv('S8_DEPLOYMENT', 'test')
-    
 
-def download_onchain_data():
+store = open_store(DATA_DIR / DEPLOYMENT)
+
+ONCHAIN_SIGNATURES = [VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1, PROPOSAL_CREATED_2, PROPOSAL_CREATED_4, PROPOSAL_DEADLINE_UPDATED]
+
+# Events that say when votes can happen, as opposed to the votes themselves.
+PROPOSAL_SIGNATURES = [PROPOSAL_CREATED_2, PROPOSAL_CREATED_4, PROPOSAL_DEADLINE_UPDATED]
+VOTE_SIGNATURES = [VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1]
+
+def plan_onchain_client(clientCls, max_workers=None):
 
     config, _ = load_config()
 
@@ -42,56 +55,349 @@ def download_onchain_data():
     if rpc is None:
         raise Exception("S8_JSON_RPC environment variable is not set")
 
-    client = JsonRpcHistHttpClient(rpc)
-    client.connect()
+    log_cache = LogCache(os.getenv('S8_LOG_CACHE_DIR', DATA_DIR / 'cache' / 'eth_getLogs'))
+
+    client = clientCls(rpc, max_workers=max_workers, log_cache=log_cache)
 
     abi = ABI.from_file('gov', ABIS_DIR / DEPLOYMENT / 'gov.json')
     abis = ABISet('op', [abi])
 
     client.set_abis(abis)
 
-    signatures = [VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1, PROPOSAL_CREATED_2, PROPOSAL_CREATED_4]
-
-    for signature in signatures:
+    for signature in ONCHAIN_SIGNATURES:
         client.plan_event(chain_id, gov_address, signature)
 
+    return config, client
+
+def open_onchain_writers(abis, append=False):
+
     meta = ['block_number', 'transaction_index', 'log_index']
 
     writers = {}
-    for signature in signatures:
+    for signature in ONCHAIN_SIGNATURES:
         field_names = meta + list(map(camel_to_snake, abis.get_by_signature(signature).fields))
-        
-        (DATA_DIR / DEPLOYMENT).mkdir(parents=True, exist_ok=True)
+        # Block numbers and indexes, so they always fit an int64.
+        types = ['int64'] * len(meta) + signature_types(signature)
 
-        fname = DATA_DIR / DEPLOYMENT / (signature + '.csv')
+        writers[signature] = store.writer(signature, field_names, types, append)
 
-        fs = open(fname, mode='w', newline='')
-        print("Creating/Overwriting: " + str(fname.absolute()))
-        writer = csv.DictWriter(fs, fieldnames=field_names)
-        writer.writeheader()
-        writers[signature] = writer
+    return writers
+
+def flush_onchain_writers(writers):
+    for writer in writers.values():
+        writer.flush()
 
-    for event in client.read(from_block=config['start_block'], to_block=config['end_block']):
+def resolve_end_block(config):
 
-        signature = event['signature']
+    if config['end_block'] is None:
+        return get_web3().eth.block_number
 
-        writer = writers[signature]
+    return config['end_block']
 
-        del event['signature']
-        del event['sighash']
+def onchain_checkpoint():
+    return CoverageCheckpoint(DATA_DIR / DEPLOYMENT / 'onchain_coverage.json')
 
-        if signature == VOTE_CAST_1:
-            del event['reason']
-            writer.writerow(event)
-        elif signature == VOTE_CAST_WITH_PARAMS_1:
-            del event['reason']
-            event['params'] = event['params'].hex()
-            writer.writerow(event)
+def plan_onchain_sync(config, client, to_block, incremental=False):
+    """
+    Open the writers and work out which (from_block, to_block, signatures) ranges still need fetching.
+
+    A full sync re-creates every table and covers start_block..to_block in one pass.  An incremental sync
+    appends, and only fetches what onchain_coverage.json says is missing for each event topic.
+    """
+
+    chain_id = config['chain_id']
+    gov_address = config['gov']['address']
+    from_block = config['start_block']
+
+    checkpoint = onchain_checkpoint()
+    topics = client.planned_topics(chain_id, gov_address)
+
+    if not incremental:
+        for topic in topics:
+            checkpoint.reset(chain_id, gov_address, topic)
+
+        writers = open_onchain_writers(client.abis)
+        return writers, checkpoint, [(from_block, to_block, None)]
+
+    # Drop rows an interrupted run appended beyond what the checkpoint vouches for.
+    for topic, signature in topics.items():
+        if store.exists(signature):
+            store.prune(signature, lambda block_number: checkpoint.is_covered(chain_id, gov_address, topic, block_number))
         else:
-            writer.writerow(event)
+            checkpoint.reset(chain_id, gov_address, topic)
+
+    writers = open_onchain_writers(client.abis, append=True)
+
+    gaps = defaultdict(list)
+    for topic, signature in topics.items():
+        for gap_from_block, gap_to_block in checkpoint.gaps(chain_id, gov_address, topic, from_block, to_block):
+            gaps[(gap_from_block, gap_to_block)].append(signature)
+
+    plan = [(gap_from_block, gap_to_block, signatures) for (gap_from_block, gap_to_block), signatures in sorted(gaps.items())]
+
+    if not plan:
+        print(f"Already up to date through block {to_block}.")
+
+    for gap_from_block, gap_to_block, signatures in plan:
+        print(f"Fetching {len(signatures)} event(s) from block {gap_from_block} to {gap_to_block}")
+
+    return writers, checkpoint, plan
+
+def record_onchain_sync(config, client, writers, checkpoint, from_block, to_block, signatures):
+
+    flush_onchain_writers(writers)
+
+    for topic in client.planned_topics(config['chain_id'], config['gov']['address'], signatures):
+        checkpoint.add(config['chain_id'], config['gov']['address'], topic, from_block, to_block)
+
+    checkpoint.save()
+
+def proposal_windows(from_block, to_block):
+    """
+    Merged [start_block, end_block] voting windows of every proposal downloaded so far, clipped to [from_block, to_block].
+
+    A ProposalDeadlineUpdated pushes a proposal's end_block out to its new deadline.
+    """
+
+    deadlines = {}
+
+    if store.exists(PROPOSAL_DEADLINE_UPDATED):
+        for row in store.rows(PROPOSAL_DEADLINE_UPDATED):
+            deadlines[row['proposal_id']] = max(deadlines.get(row['proposal_id'], 0), int(row['deadline']))
+
+    windows = []
+
+    for signature in (PROPOSAL_CREATED_2, PROPOSAL_CREATED_4):
+
+        if not store.exists(signature):
+            continue
+
+        for row in store.rows(signature):
+            start_block = int(row['start_block'])
+            end_block = max(int(row['end_block']), deadlines.get(row['proposal_id'], 0))
+
+            if end_block >= from_block and start_block <= to_block:
+                windows.append([max(start_block, from_block), min(end_block, to_block)])
+
+    return merge_ranges(windows)
+
+def plan_onchain_reads(writers, from_block, to_block, signatures, targeted=False):
+    """
+    The client.read() calls that cover one planned range.
+
+    Normally that's a single read.  With `targeted`, proposal events are read over the whole range
+    first, and votes are then only read inside the proposals' voting windows, since they can't
+    appear anywhere else.  This is a generator, so the windows are worked out after the caller has
+    consumed (and written) the first read.
+    """
+
+    if not targeted:
+        yield from_block, to_block, signatures
+        return
+
+    signatures = signatures or ONCHAIN_SIGNATURES
+
+    proposal_signatures = [s for s in signatures if s in PROPOSAL_SIGNATURES]
+    vote_signatures = [s for s in signatures if s not in PROPOSAL_SIGNATURES]
+
+    if proposal_signatures:
+        yield from_block, to_block, proposal_signatures
+
+    if not vote_signatures:
+        return
+
+    flush_onchain_writers(writers)
+
+    windows = proposal_windows(from_block, to_block)
+
+    print(f"Fetching votes over {len(windows)} proposal window(s), {sum(w_to - w_from + 1 for w_from, w_to in windows)} of {to_block - from_block + 1} block(s)")
+
+    for window_from_block, window_to_block in windows:
+        yield window_from_block, window_to_block, vote_signatures
+
+def retract_onchain_sync(config, client, writers, checkpoint, fork_block, signatures=None):
+    """
+    Drop every row and all coverage from `fork_block` on, after a reorg orphaned those blocks.
+
+    With `signatures`, only those streams are retracted, ie. the ones that are about to be re-read.
+    """
+
+    chain_id = config['chain_id']
+    gov_address = config['gov']['address']
+
+    flush_onchain_writers(writers)
+
+    for topic in client.planned_topics(chain_id, gov_address, signatures):
+        checkpoint.truncate(chain_id, gov_address, topic, fork_block - 1)
+
+    checkpoint.save()
+
+    # The writers only append, so they keep writing after whatever is left.
+    for topic, signature in client.planned_topics(chain_id, gov_address, signatures).items():
+        store.prune(signature, lambda block_number: block_number < fork_block)
+
+def write_onchain_event(writers, event):
+
+    signature = event['signature']
+
+    writer = writers[signature]
+
+    del event['signature']
+    del event['sighash']
+
+    if signature == VOTE_CAST_1:
+        del event['reason']
+        writer.writerow(event)
+    elif signature == VOTE_CAST_WITH_PARAMS_1:
+        del event['reason']
+        event['params'] = event['params'].hex()
+        writer.writerow(event)
+    else:
+        writer.writerow(event)
+
+def download_onchain_data(max_workers=None, incremental=False, targeted=False):
+
+    config, client = plan_onchain_client(JsonRpcHistHttpClient, max_workers)
+
+    writers, checkpoint, plan = plan_onchain_sync(config, client, resolve_end_block(config), incremental)
+
+    for from_block, to_block, signatures in plan:
+
+        for read_from_block, read_to_block, read_signatures in plan_onchain_reads(writers, from_block, to_block, signatures, targeted):
+            for event in client.read(from_block=read_from_block, to_block=read_to_block, signatures=read_signatures):
+                write_onchain_event(writers, event)
+
+        record_onchain_sync(config, client, writers, checkpoint, from_block, to_block, signatures)
+
+async def download_onchain_data_async(max_workers=None, incremental=False, targeted=False):
+
+    config, client = plan_onchain_client(JsonRpcHistAsyncHttpClient, max_workers)
+
+    writers, checkpoint, plan = plan_onchain_sync(config, client, resolve_end_block(config), incremental)
+
+    for from_block, to_block, signatures in plan:
+
+        for read_from_block, read_to_block, read_signatures in plan_onchain_reads(writers, from_block, to_block, signatures, targeted):
+            async for event in client.read(from_block=read_from_block, to_block=read_to_block, signatures=read_signatures):
+                write_onchain_event(writers, event)
+
+        record_onchain_sync(config, client, writers, checkpoint, from_block, to_block, signatures)
  
 
-def download_offchain_data():
+def follow(max_workers=None, confirmations=0, poll_interval=None, proposal_id=None):
+    """
+    Catch up incrementally, then keep appending new votes as blocks arrive, retracting any a reorg orphans.
+
+    With a proposal id, its result is re-calculated whenever new votes come in.
+    """
+
+    download_onchain_data(max_workers, incremental=True)
+
+    config, client = plan_onchain_client(JsonRpcHistHttpClient, max_workers)
+
+    checkpoint = onchain_checkpoint()
+    writers = open_onchain_writers(client.abis, append=True)
+
+    chain_id = config['chain_id']
+    gov_address = config['gov']['address']
+
+    last_block = min(checkpoint.ranges(chain_id, gov_address, topic)[-1][1] for topic in client.planned_topics(chain_id, gov_address, VOTE_SIGNATURES))
+
+    follower = HeadFollower(client, client.connect(), last_block, VOTE_SIGNATURES, int(confirmations), poll_interval)
+
+    for action in follower.follow(config['end_block']):
+
+        if action[0] == 'reorg':
+            # The follower only re-reads the votes, so the other streams are left as they are.
+            retract_onchain_sync(config, client, writers, checkpoint, action[1], VOTE_SIGNATURES)
+            continue
+
+        _, from_block, to_block, events = action
+
+        for event in events:
+            write_onchain_event(writers, event)
+
+        record_onchain_sync(config, client, writers, checkpoint, from_block, to_block, VOTE_SIGNATURES)
+
+        if len(events):
+            print(f"{len(events)} new vote(s) in blocks {from_block} to {to_block}")
+
+            if proposal_id is not None:
+                calculate(proposal_id)
+
+EAS_META = ['attester', 'data', 'expirationTime', 'id', 'ipfsHash', 'isOffchain', 'recipient', 'refUID',  'revocable', 'revocationTime', 'revoked', 'schemaId', 'time', 'timeCreated', 'txid']
+
+# Everything else in EAS_META is a string.
+EAS_META_TYPES = {'expirationTime': 'uint64', 'revocationTime': 'uint64', 'time': 'uint64', 'timeCreated': 'uint64',
+                  'isOffchain': 'bool', 'revocable': 'bool', 'revoked': 'bool'}
+
+def offchain_watermark():
+    return AttestationWatermark(DATA_DIR / DEPLOYMENT / 'offchain_watermark.json')
+
+def download_attestations(client, schema_meta, watermark, incremental=False, data_prefix=None):
+    """
+    Write one schema's attestations to its table.
+
+    A full download overwrites the table.  An incremental one only fetches attestations created or
+    revoked since the schema's watermark, and merges them into the existing rows by id.
+
+    With a `data_prefix`, only attestations whose encoded data starts with it are fetched, and merged
+    in the same way.  That's a partial view of the schema, so the watermark is left alone.
+    """
+
+    name = schema_meta.name
+
+    field_names = EAS_META + list(schema_meta.kwtypes.keys())
+    types = [EAS_META_TYPES.get(column, 'string') for column in EAS_META] + list(schema_meta.kwtypes.values())
+
+    since = watermark.since(schema_meta.schema_id) if incremental and data_prefix is None and store.exists(name) else None
+
+    rows = {}
+
+    if since is None and data_prefix is None:
+        print("Creating/Overwriting: " + store.describe(name))
+        watermark.reset(schema_meta.schema_id)
+    else:
+        print("Updating: " + store.describe(name))
+        if store.exists(name):
+            rows = {row['id'] : row for row in store.rows(name)}
+
+    # decodedDataJson isn't needed, `data` is decoded locally instead.
+    attestations = list(client.get_attestations(schema_meta.schema_id, since, fields=EAS_META, data_prefix=data_prefix))
+
+    fetched = len(attestations)
+
+    # One bad attestion, can't be decoded.
+    attestations = [a for a in attestations if a['id'] != '0x01b52865c05bcadc420c82e14d59cb06ed0f4c5845e948b77c80ea4af599294e']
+
+    payloads, errors = schema_meta.decode_batch([attestation['data'] for attestation in attestations])
+
+    for idx, error in errors:
+        print(f"❌ Bad {schema_meta.name} attestion: {attestations[idx]['id']} - {attestations[idx]['data']}")
+
+    for attestation, payload in zip(attestations, payloads):
+
+        if payload is None:
+            continue
+
+        del attestation['data']
+
+        attestation.update(payload)
+
+        rows[attestation['id']] = attestation
+
+    if since is not None:
+        print(f"Fetched {fetched} new or revoked {schema_meta.name} attestation(s)")
+    elif data_prefix is not None:
+        print(f"Fetched {fetched} matching {schema_meta.name} attestation(s)")
+
+    store.write(name, field_names, [rows[attestation_id] for attestation_id in sorted(rows)], types)
+
+    if data_prefix is None:
+        watermark.advance(schema_meta.schema_id, rows.values())
+        watermark.save()
+
+def download_offchain_data(incremental=False):
 
     _, config = load_config()
 
@@ -100,17 +406,15 @@ def download_offchain_data():
     vote_client = EASGraphQLClient(config['votes_eas'])
     prop_client = EASGraphQLClient(config['prop_eas'])
 
-    for schema_meta in list(meta.values()):
+    watermark = offchain_watermark()
+
+    def download_schema(schema_meta):
 
         if schema_meta.name == 'CreateProposal':
             client = prop_client
         else:
             client = vote_client
 
-        field_names = schema_meta.kwtypes.keys()
-
-        eas_meta = ['attester', 'data', 'expirationTime', 'id', 'ipfsHash', 'isOffchain', 'recipient', 'refUID',  'revocable', 'revocationTime', 'revoked', 'schemaId', 'time', 'timeCreated', 'txid']
-
         schema = client.get_schemas(schema_meta.schema_id)[0]
 
         # print(schema_meta.name)
@@ -120,50 +424,38 @@ def download_offchain_data():
             #pprint(schema['schema'])
         except Exception as e:
             print(f"❌ Bad schema for {schema_meta.name} [id={schema_meta.schema_id}]")
-            continue
+            return
 
-        (DATA_DIR / DEPLOYMENT).mkdir(parents=True, exist_ok=True)
-        fname = DATA_DIR / DEPLOYMENT / (schema_meta.name + '.csv')
-        fs = open(fname, mode='w', newline='')
-        print("Creating/Overwriting: " + str(fname.absolute()))
-        writer = csv.DictWriter(fs, fieldnames=eas_meta + list(schema_meta.kwtypes.keys()))
-        writer.writeheader()
+        download_attestations(client, schema_meta, watermark, incremental)
 
-        attestations = client.get_attestations(schema_meta.schema_id)
+    # Schemas are independent (and CreateProposal may live on another indexer), so fetch them all at once.
+    with ThreadPoolExecutor(max_workers=len(meta)) as executor:
+        for future in [executor.submit(download_schema, schema_meta) for schema_meta in meta.values()]:
+            future.result()
 
-        for attestation in attestations:
+def download_proposal_votes(proposal_id: str):
+    """Fetch just one off-chain proposal's votes, filtered by the indexer, and merge them into the Vote table."""
 
-            msg = ''
+    _, config = load_config()
 
-            # One bad attestion, can't be decoded.
-            if attestation['id'] == '0x01b52865c05bcadc420c82e14d59cb06ed0f4c5845e948b77c80ea4af599294e':
-                continue
-                
-            try:
-                payload = schema_meta.decode(attestation['data'])
+    vote_meta = all_meta[DEPLOYMENT]['vote']
 
-                del attestation['decodedDataJson']
-                del attestation['data']
-            
-                attestation.update(payload)
-                
-                writer.writerow(attestation)
-                
-            except Exception as e:
-                print(f"❌ Bad {schema_meta.name} attestion: {attestation['id']} - {attestation['data']}")
+    client = EASGraphQLClient(config['votes_eas'])
+
+    download_attestations(client, vote_meta, offchain_watermark(), data_prefix=vote_meta.data_prefix(proposal_id))
 
 def download_proposal_context():
 
     on_chain_config, off_chain_config = load_config()
     modules = {v['address'].lower() : v['name'] for v in on_chain_config['gov']['modules']}
 
-    onchain_creates_2 = pd.read_csv(DATA_DIR / DEPLOYMENT / (PROPOSAL_CREATED_2 + '.csv'))
-    onchain_creates_4 = pd.read_csv(DATA_DIR / DEPLOYMENT / (PROPOSAL_CREATED_4 + '.csv'))
+    onchain_creates_2 = store.read(PROPOSAL_CREATED_2)
+    onchain_creates_4 = store.read(PROPOSAL_CREATED_4)
     onchain_creates = pd.concat([onchain_creates_2, onchain_creates_4])
     onchain_records = onchain_creates.iterrows()
 
     try:
-        offchain_creates = pd.read_csv(DATA_DIR / DEPLOYMENT / 'CreateProposal.csv')
+        offchain_creates = store.read('CreateProposal')
     except FileNotFoundError:
         offchain_creates = pd.DataFrame()
     offchain_records = offchain_creates.iterrows()
@@ -171,6 +463,10 @@ def download_proposal_context():
     w3 = get_web3()    
     jrpc = JsonRpcContractCalls(w3)
 
+    # Queue every eth_call first, then send them as a handful of JSON-RPC batches.
+    batch = jrpc.batch()
+
+    queued = []
 
     for idx, row in list(onchain_records) + list(offchain_records):
 
@@ -193,13 +489,24 @@ def download_proposal_context():
         if int(onchain_proposal_id) == 0:
             quorum = None
             votable_supply = None
-            proposal_type_info = jrpc.get_proposal_type_info(onchain_config['ptc']['address'], proposal_type_id, asof_block_num)
-            counting_mode = jrpc.get_counting_mode(onchain_config['gov']['address'], asof_block_num)
+            proposal_type_info = batch.get_proposal_type_info(onchain_config['ptc']['address'], proposal_type_id, asof_block_num)
+            counting_mode = batch.get_counting_mode(onchain_config['gov']['address'], asof_block_num)
         else:
-            quorum = jrpc.get_quorum(onchain_config['gov']['address'], proposal_id)
-            votable_supply = jrpc.get_votable_supply(onchain_config['gov']['address'], asof_block_num)
-            proposal_type_info = jrpc.get_proposal_type_info(onchain_config['ptc']['address'], proposal_type_id, asof_block_num)
-            counting_mode = jrpc.get_counting_mode(onchain_config['gov']['address'], asof_block_num)
+            quorum = batch.get_quorum(onchain_config['gov']['address'], proposal_id)
+            votable_supply = batch.get_votable_supply(onchain_config['gov']['address'], asof_block_num)
+            proposal_type_info = batch.get_proposal_type_info(onchain_config['ptc']['address'], proposal_type_id, asof_block_num)
+            counting_mode = batch.get_counting_mode(onchain_config['gov']['address'], asof_block_num)
+
+        queued.append((row, proposal_id, asof_block_num, proposal_type_id, quorum, votable_supply, proposal_type_info, counting_mode))
+
+    batch.execute()
+
+    for row, proposal_id, asof_block_num, proposal_type_id, quorum, votable_supply, proposal_type_info, counting_mode in queued:
+
+        quorum = quorum.result() if quorum is not None else None
+        votable_supply = votable_supply.result() if votable_supply is not None else None
+        proposal_type_info = proposal_type_info.result()
+        counting_mode = counting_mode.result()
         
         if 'voting_module' in row:
 
@@ -227,11 +534,23 @@ def download_proposal_context():
         json.dump(out, fs, indent=2)
         fs.close()
 
-def download_all_data():
+async def download_all_data_async(max_workers=None, incremental=False, targeted=False):
+
+    loop = asyncio.get_running_loop()
+
+    # The EAS download is still blocking, so it runs on the loop's default executor while
+    # eth_getLogs traffic is in flight; proposal context needs both of their outputs.
+    await asyncio.gather(download_onchain_data_async(max_workers, incremental, targeted), loop.run_in_executor(None, download_offchain_data, incremental))
+    await loop.run_in_executor(None, download_proposal_context)
+
+def download_all_data(max_workers=None, use_async=False, incremental=False, targeted=False):
 
-    download_onchain_data()
-    download_offchain_data()
-    download_proposal_context()
+    if use_async:
+        asyncio.run(download_all_data_async(max_workers, incremental, targeted))
+    else:
+        download_onchain_data(max_workers, incremental, targeted)
+        download_offchain_data(incremental)
+        download_proposal_context()
 
 def list_proposals():
 
@@ -247,9 +566,45 @@ def calculate(proposal_id: str):
     prop.load_context()
     prop.show_result()
 
+def calculate_all(*proposal_ids, processes=None):
+    """
+    Calculate every proposal's result, or just the ones given, in one go.
+
+    The data is loaded once, and the votes of every proposal are grouped and summed in one pass.
+    The tallies can then be spread over several processes (--processes, or S8_CALC_PROCESSES).
+    """
+
+    prop_lister = ProposalLister.load()
+
+    # An id that isn't found is reported in its place, like any other proposal that fails.
+    lookups = []
+
+    if proposal_ids:
+        for proposal_id in proposal_ids:
+            try:
+                lookups.append((proposal_id, prop_lister.get_proposal(proposal_id), None))
+            except Exception as e:
+                lookups.append((proposal_id, None, f"{type(e).__name__}: {e}"))
+    else:
+        lookups = [(prop.id, prop, None) for prop in prop_lister.off_chain + prop_lister.on_chain + prop_lister.hybrid]
+
+    groups = VoteGroups()
+
+    results = iter(tally_proposals([prop for _, prop, _ in lookups if prop is not None], groups, processes))
+
+    for proposal_id, prop, error in lookups:
+
+        report = ''
+        if prop is not None:
+            proposal_id, report, error = next(results)
+
+        print(report, end='')
+        if error:
+            print(f"❌ Couldn't calculate {proposal_id}: {error}")
+
 def main():
 
-    argh.dispatch_commands([download_all_data,download_onchain_data, download_offchain_data, download_proposal_context, list_proposals, calculate])
+    argh.dispatch_commands([download_all_data,download_onchain_data, download_offchain_data, download_proposal_votes, download_proposal_context, follow, list_proposals, calculate, calculate_all])
 
 
 if __name__ == '__main__':
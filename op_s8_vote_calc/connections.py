@@ -0,0 +1,123 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3, AsyncWeb3
+
+from .endpoints import EndpointPool, PooledHTTPProvider, PooledAsyncHTTPProvider
+
+
+def resolve_http_settings():
+
+    try:
+        pool_size = int(os.getenv('S8_HTTP_POOL_SIZE', 32))
+        assert pool_size > 0
+    except:
+        pool_size = 32
+
+    try:
+        timeout = float(os.getenv('S8_HTTP_TIMEOUT', 30))
+        assert timeout > 0
+    except:
+        timeout = 30
+
+    return pool_size, timeout
+
+
+class ConnectionPool:
+    """
+    One keep-alive requests.Session per host, and one Web3 per URL, shared by every client.
+
+    A JSON-RPC URL may be a comma separated list of endpoints; its Web3 then load balances over
+    them through an EndpointPool, whose health is shared by the blocking and async clients.
+
+    Sessions are keyed by scheme + host, so the JSON-RPC node and both EAS GraphQL endpoints each
+    get their own pool of reusable TCP / TLS connections.  The pool grows when a caller asks for
+    more concurrent connections than it was created with (eg. --max-workers 64).
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+
+        default_pool_size, default_timeout = resolve_http_settings()
+
+        self.pool_size = pool_size or default_pool_size
+        self.timeout = timeout or default_timeout
+
+        self.sessions = {}
+        self.web3s = {}
+        self.endpoint_pools = {}
+        self.lock = threading.Lock()
+
+    def session(self, url, pool_size=None):
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+
+        pool_size = max(pool_size or 0, self.pool_size)
+
+        with self.lock:
+            session, current_pool_size = self.sessions.get(key, (None, 0))
+
+            if session is None:
+                session = requests.Session()
+
+            if pool_size > current_pool_size:
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount(f"{parts.scheme}://", adapter)
+                self.sessions[key] = (session, pool_size)
+
+        return session
+
+    def post(self, url, **kwargs):
+
+        kwargs.setdefault('timeout', self.timeout)
+
+        return self.session(url).post(url, **kwargs)
+
+    def endpoint_pool(self, urls):
+
+        with self.lock:
+            if urls not in self.endpoint_pools:
+                self.endpoint_pools[urls] = EndpointPool(urls)
+
+        return self.endpoint_pools[urls]
+
+    def web3(self, urls, pool_size=None):
+
+        endpoints = self.endpoint_pool(urls)
+
+        providers = {}
+        for endpoint in endpoints.endpoints:
+            session = self.session(endpoint.url, pool_size)
+            providers[endpoint.url] = Web3.HTTPProvider(endpoint.url, session=session, request_kwargs={'timeout': self.timeout},
+                                                        exception_retry_configuration=None)
+
+        with self.lock:
+            if urls not in self.web3s:
+                self.web3s[urls] = Web3(PooledHTTPProvider(endpoints, providers))
+
+        return self.web3s[urls]
+
+    async def async_web3(self, urls, pool_size=None):
+
+        # aiohttp sessions are bound to the event loop that created them, so these aren't cached
+        # here; the caller owns the sessions and closes them with `w3.provider.disconnect()`.
+        pool_size = max(pool_size or 0, self.pool_size)
+
+        endpoints = self.endpoint_pool(urls)
+
+        providers = {}
+        for endpoint in endpoints.endpoints:
+            provider = AsyncWeb3.AsyncHTTPProvider(endpoint.url, exception_retry_configuration=None)
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size),
+                                            timeout=aiohttp.ClientTimeout(total=self.timeout))
+            await provider.cache_async_session(session)
+            providers[endpoint.url] = provider
+
+        return AsyncWeb3(PooledAsyncHTTPProvider(endpoints, providers))
+
+
+pool = ConnectionPool()
@@ -0,0 +1,461 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+
+import aiohttp
+import requests
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+
+logr = logging.getLogger(__name__)
+
+# JSON-RPC error codes providers use for "slow down" or "try again", as opposed to a bad request.
+TRANSIENT_RPC_ERROR_CODES = (-32603, 429)
+
+# "Limit exceeded".  Some providers mean a rate limit by it, but Infura & co. also send it for an
+# eth_getLogs that matched too many logs ("query returned more than 10000 results"), which only
+# a smaller range fixes.  So it's only retried when the message says it's a rate limit.
+LIMIT_EXCEEDED_RPC_ERROR_CODE = -32005
+
+# How providers word an eth_getLogs range that is too big, whatever code they send it with.
+RANGE_ERROR_MESSAGES = ('returned more than', 'too many results', 'exceeds max results', 'block range',
+                        'range is too large', 'range too large', 'response size exceeded', 'log response size')
+
+def resolve_endpoint_settings():
+
+    try:
+        rate = float(os.getenv('S8_JSON_RPC_RATE_LIMIT', 0))
+        assert rate >= 0
+    except:
+        rate = 0
+
+    try:
+        retries = int(os.getenv('S8_JSON_RPC_RETRIES', 5))
+        assert retries >= 0
+    except:
+        retries = 5
+
+    try:
+        failure_threshold = int(os.getenv('S8_JSON_RPC_FAILURE_THRESHOLD', 5))
+        assert failure_threshold > 0
+    except:
+        failure_threshold = 5
+
+    return rate, retries, failure_threshold
+
+def split_urls(urls):
+    return [url.strip() for url in urls.split(',') if url.strip()]
+
+def status_of(e):
+
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return e.response.status_code
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status
+    return None
+
+def retry_after_of(e):
+
+    headers = None
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        headers = e.response.headers
+    elif isinstance(e, aiohttp.ClientResponseError):
+        headers = e.headers
+
+    try:
+        return float(headers['Retry-After'])
+    except:
+        return None
+
+def is_timeout_error(e):
+    return isinstance(e, (requests.exceptions.Timeout, asyncio.TimeoutError))
+
+def is_transient_error(e):
+    """True for errors that say more about the endpoint right now than about the request."""
+
+    if isinstance(e, TransientRPCError):
+        return True
+
+    status = status_of(e)
+    if status is not None:
+        return status == 429 or status >= 500
+
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+def is_rate_limit_message(message):
+
+    message = str(message).lower()
+
+    return 'rate limit' in message or 'too many requests' in message
+
+def is_range_error_object(error):
+    """True if a JSON-RPC error object says an eth_getLogs range matched too much, rather than that the endpoint is busy."""
+
+    message = str(error.get('message', '')).lower()
+
+    if is_rate_limit_message(message):
+        return False
+
+    return error.get('code') == LIMIT_EXCEEDED_RPC_ERROR_CODE or any(m in message for m in RANGE_ERROR_MESSAGES)
+
+def is_transient_response(response, method=None):
+
+    if not isinstance(response, dict) or 'error' not in response:
+        return False
+
+    error = response['error']
+    if not isinstance(error, dict):
+        return False
+
+    if is_rate_limit_message(error.get('message', '')):
+        return True
+
+    # Even under a "try again" code (eg. -32603), a range that's too big would just fail again.
+    if method == 'eth_getLogs' and is_range_error_object(error):
+        return False
+
+    return error.get('code') in TRANSIENT_RPC_ERROR_CODES
+
+
+class TransientRPCError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    `rate` requests per second, with bursts of up to `burst`.  A rate of 0 means unlimited.
+
+    `reserve()` takes a token and returns how long the caller has to wait before using it, so the
+    same bucket works for threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+
+        if not self.rate:
+            return 0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class Endpoint:
+    """
+    One JSON-RPC URL, its rate limit, and its health.
+
+    Latency is tracked as an exponential moving average.  After `failure_threshold` transient
+    failures in a row the circuit opens, and the endpoint gets no traffic for `cooldown` seconds
+    (doubling on every trip, up to `max_cooldown`).  After that one request is let through, and
+    the circuit closes again if it succeeds.
+    """
+
+    def __init__(self, url, rate=0, failure_threshold=5, cooldown=5, max_cooldown=300):
+        self.url = url
+        self.bucket = TokenBucket(rate)
+
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.latency = None
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0
+        self.trial_in_flight = False
+
+        self.requests = 0
+        self.failures = 0
+        self.trips = 0
+
+    def is_open(self, now):
+        return now < self.open_until or (self.open_until and self.trial_in_flight)
+
+    def score(self):
+        # Seconds of latency, plus a second per recent failure so a flaky endpoint loses to a slow one.
+        latency = self.latency if self.latency is not None else 0
+        return latency + self.consecutive_failures
+
+    def record_success(self, latency):
+
+        self.requests += 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+        if self.open_until:
+            logr.info(f"✅ {self.url} is healthy again")
+
+        self.consecutive_failures = 0
+        self.cooldown = self.base_cooldown
+        self.open_until = 0
+        self.trial_in_flight = False
+
+    def record_failure(self, pause=None):
+
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+
+        now = time.monotonic()
+
+        if self.open_until or self.consecutive_failures >= self.failure_threshold:
+            self.trips += 1
+            self.open_until = now + self.cooldown
+            logr.warning(f"🔌 Circuit open for {self.url} for {self.cooldown:.0f}s after {self.consecutive_failures} failure(s)")
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+
+        if pause:
+            self.open_until = max(self.open_until, now + pause)
+
+
+class EndpointPool:
+    """
+    Routes JSON-RPC requests across one or more endpoints.
+
+    Each request goes to the healthiest endpoint whose circuit is closed (lowest latency, fewest
+    recent failures), waits for that endpoint's rate limit, and on a transient failure (429, 5xx,
+    connection error, rate-limit error object) is retried with full-jitter exponential backoff,
+    preferring an endpoint it hasn't just failed on.  Anything else, eg. an eth_getLogs range the
+    provider rejects, is returned or raised untouched so the caller can handle it.
+    """
+
+    def __init__(self, urls, rate=None, retries=None, failure_threshold=None, backoff=0.5, max_backoff=30):
+
+        default_rate, default_retries, default_failure_threshold = resolve_endpoint_settings()
+
+        rate = default_rate if rate is None else rate
+        failure_threshold = failure_threshold or default_failure_threshold
+
+        self.endpoints = [Endpoint(url, rate, failure_threshold) for url in split_urls(urls)]
+
+        if len(self.endpoints) == 0:
+            raise Exception(f"❌ No JSON-RPC endpoints in {urls!r}")
+
+        self.retries = default_retries if retries is None else retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.lock = threading.Lock()
+
+    def pick(self, avoid=()):
+
+        with self.lock:
+            now = time.monotonic()
+
+            candidates = [e for e in self.endpoints if not e.is_open(now)] or self.endpoints
+            candidates = [e for e in candidates if e.url not in avoid] or candidates
+
+            endpoint = min(candidates, key=lambda e: (e.is_open(now), e.score(), e.requests))
+
+            # A half-open endpoint only gets one trial request at a time.
+            if endpoint.open_until and now >= endpoint.open_until:
+                endpoint.trial_in_flight = True
+
+            wait = max(0, endpoint.open_until - now) if endpoint.is_open(now) else 0
+
+        return endpoint, wait + endpoint.bucket.reserve()
+
+    def delay(self, attempt, e):
+
+        retry_after = retry_after_of(e)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def record(self, endpoint, started, e=None):
+
+        with self.lock:
+            if e is None:
+                endpoint.record_success(time.monotonic() - started)
+            else:
+                endpoint.record_failure(retry_after_of(e))
+
+    def call(self, fn, passthrough=None):
+        """Run `fn(endpoint)`, retrying transient failures on the healthiest endpoint available."""
+
+        avoid = set()
+
+        for attempt in range(self.retries + 1):
+
+            endpoint, wait = self.pick(avoid)
+            if wait:
+                time.sleep(wait)
+
+            started = time.monotonic()
+
+            try:
+                ans = fn(endpoint)
+            except Exception as e:
+                if (passthrough and passthrough(e)) or not is_transient_error(e):
+                    with self.lock:
+                        endpoint.trial_in_flight = False
+                    raise e
+
+                self.record(endpoint, started, e)
+
+                if attempt == self.retries:
+                    raise e
+
+                delay = self.delay(attempt, e)
+                logr.warning(f"🔁 {endpoint.url} failed ({e}), retrying in {delay:.1f}s")
+                avoid = {endpoint.url}
+                time.sleep(delay)
+                continue
+
+            self.record(endpoint, started)
+            return ans
+
+    async def async_call(self, fn, passthrough=None):
+        """Coroutine twin of :py:meth:`call`, where `fn(endpoint)` returns an awaitable."""
+
+        avoid = set()
+
+        for attempt in range(self.retries + 1):
+
+            endpoint, wait = self.pick(avoid)
+            if wait:
+                await asyncio.sleep(wait)
+
+            started = time.monotonic()
+
+            try:
+                ans = await fn(endpoint)
+            except Exception as e:
+                if (passthrough and passthrough(e)) or not is_transient_error(e):
+                    with self.lock:
+                        endpoint.trial_in_flight = False
+                    raise e
+
+                self.record(endpoint, started, e)
+
+                if attempt == self.retries:
+                    raise e
+
+                delay = self.delay(attempt, e)
+                logr.warning(f"🔁 {endpoint.url} failed ({e}), retrying in {delay:.1f}s")
+                avoid = {endpoint.url}
+                await asyncio.sleep(delay)
+                continue
+
+            self.record(endpoint, started)
+            return ans
+
+    def report(self):
+
+        for e in self.endpoints:
+            latency = f"{e.latency * 1000:.0f}ms" if e.latency is not None else "n/a"
+            logr.info(f"🌐 {e.url}: {e.requests} request(s), {e.failures} failure(s), {e.trips} circuit trip(s), latency {latency}")
+
+
+def passthrough_for(method):
+    # A timed out eth_getLogs usually means the range was too big, which the log clients handle
+    # by splitting it; retrying the same range elsewhere would just time out again.  (Error
+    # objects that say the range is too big are handed back by is_transient_response.)
+    return is_timeout_error if method == 'eth_getLogs' else None
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """
+    web3 provider that sends every request through an EndpointPool.
+
+    `providers` maps each endpoint's URL to a plain HTTPProvider (with web3's own retries turned
+    off) that does the actual HTTP.  JSON-RPC error objects that mean "slow down" are retried like
+    HTTP errors; every other response goes back to web3 as is.
+    """
+
+    def __init__(self, pool, providers, **kwargs):
+        super().__init__(**kwargs)
+
+        self.pool = pool
+        self.providers = providers
+        self.endpoint_uri = pool.endpoints[0].url
+
+    def __str__(self):
+        return f"RPC connection pool {', '.join(self.providers)}"
+
+    def make_request(self, method, params):
+
+        def send(endpoint):
+            response = self.providers[endpoint.url].make_request(method, params)
+            if is_transient_response(response, method):
+                raise TransientRPCError(response['error'])
+            return response
+
+        return self.pool.call(send, passthrough_for(method))
+
+    def make_batch_request(self, batch_requests):
+
+        def send(endpoint):
+            response = self.providers[endpoint.url].make_batch_request(batch_requests)
+            if is_transient_response(response):
+                raise TransientRPCError(response['error'])
+            return response
+
+        return self.pool.call(send)
+
+    def is_connected(self, show_traceback=False):
+        return any(provider.is_connected(show_traceback) for provider in self.providers.values())
+
+
+class PooledAsyncHTTPProvider(AsyncJSONBaseProvider):
+    """asyncio twin of PooledHTTPProvider, over AsyncHTTPProviders."""
+
+    def __init__(self, pool, providers, **kwargs):
+        super().__init__(**kwargs)
+
+        self.pool = pool
+        self.providers = providers
+        self.endpoint_uri = pool.endpoints[0].url
+
+    def __str__(self):
+        return f"Async RPC connection pool {', '.join(self.providers)}"
+
+    async def make_request(self, method, params):
+
+        async def send(endpoint):
+            response = await self.providers[endpoint.url].make_request(method, params)
+            if is_transient_response(response, method):
+                raise TransientRPCError(response['error'])
+            return response
+
+        return await self.pool.async_call(send, passthrough_for(method))
+
+    async def make_batch_request(self, batch_requests):
+
+        async def send(endpoint):
+            response = await self.providers[endpoint.url].make_batch_request(batch_requests)
+            if is_transient_response(response):
+                raise TransientRPCError(response['error'])
+            return response
+
+        return await self.pool.async_call(send)
+
+    async def is_connected(self, show_traceback=False):
+
+        for provider in self.providers.values():
+            if await provider.is_connected(show_traceback):
+                return True
+        return False
+
+    async def disconnect(self):
+        for provider in self.providers.values():
+            await provider.disconnect()
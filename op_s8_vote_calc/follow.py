@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+
+logr = logging.getLogger(__name__)
+
+def resolve_follow_settings():
+
+    try:
+        poll_interval = float(os.getenv('S8_FOLLOW_POLL_INTERVAL', 2))
+        assert poll_interval > 0
+    except:
+        poll_interval = 2
+
+    try:
+        reorg_depth = int(os.getenv('S8_FOLLOW_REORG_DEPTH', 64))
+        assert reorg_depth > 0
+    except:
+        reorg_depth = 64
+
+    return poll_interval, reorg_depth
+
+
+class HeadFollower:
+    """
+    Follows the chain head with a JsonRpcHistHttpClient, one poll at a time.
+
+    Keeps the hashes of the last `reorg_depth` blocks it has read.  Every poll first checks the newest
+    of those against the node; if it changed, the buffer is walked back to the last block that still
+    matches and a ('reorg', fork_block) is yielded, so the caller can retract everything it wrote from
+    fork_block on.  Then the new blocks are read and yielded as ('logs', from_block, to_block, events).
+
+    A batch is only yielded if the head block's hash is the same before and after the logs were
+    read, so logs from a block that was reorged out mid-poll are never handed out.
+    """
+
+    def __init__(self, client, w3, last_block, signatures=None, confirmations=0, poll_interval=None, reorg_depth=None):
+
+        default_poll_interval, default_reorg_depth = resolve_follow_settings()
+
+        self.client = client
+        self.w3 = w3
+        self.last_block = last_block
+        self.signatures = signatures
+        self.confirmations = confirmations
+        # From the CLI these arrive as strings.
+        self.poll_interval = float(poll_interval or default_poll_interval)
+        self.reorg_depth = int(reorg_depth or default_reorg_depth)
+
+        assert self.poll_interval > 0, f"Poll interval must be positive, got {self.poll_interval}"
+        assert self.reorg_depth > 0, f"Reorg depth must be positive, got {self.reorg_depth}"
+
+        self.hashes = OrderedDict()
+
+    def block_hash(self, block_number):
+        return self.w3.eth.get_block(block_number)['hash']
+
+    def remember(self, from_block, to_block):
+
+        for block_number in range(max(from_block, to_block - self.reorg_depth + 1), to_block + 1):
+            self.hashes[block_number] = self.block_hash(block_number)
+
+        while len(self.hashes) > self.reorg_depth:
+            self.hashes.popitem(last=False)
+
+    def find_fork(self):
+        """First block that is no longer canonical, or None if the newest remembered block still is."""
+
+        fork_block = None
+
+        for block_number in reversed(list(self.hashes.keys())):
+            if self.block_hash(block_number) == self.hashes[block_number]:
+                return fork_block
+            fork_block = block_number
+
+        if fork_block is not None:
+            logr.warning(f"⚠️ Reorg is deeper than the {self.reorg_depth} block buffer, rewinding to block {fork_block}")
+
+        return fork_block
+
+    def rewind(self, fork_block):
+
+        for block_number in [b for b in self.hashes if b >= fork_block]:
+            del self.hashes[block_number]
+
+        self.last_block = min(self.last_block, fork_block - 1)
+
+    def poll(self, end_block=None):
+
+        head = self.w3.eth.block_number - self.confirmations
+
+        if end_block is not None:
+            head = min(head, end_block)
+
+        fork_block = self.find_fork()
+
+        if fork_block is not None:
+            logr.warning(f"🔀 Reorg detected, blocks from {fork_block} are orphaned")
+            self.rewind(fork_block)
+            yield ('reorg', fork_block)
+
+        if head <= self.last_block:
+            return
+
+        from_block, to_block = self.last_block + 1, head
+
+        head_hash = self.block_hash(to_block)
+
+        events = list(self.client.read(from_block=from_block, to_block=to_block, signatures=self.signatures))
+
+        if self.block_hash(to_block) != head_hash:
+            logr.warning(f"🔀 Block {to_block} changed while reading it, retrying")
+            return
+
+        self.remember(from_block, to_block)
+        self.last_block = to_block
+
+        yield ('logs', from_block, to_block, events)
+
+    def follow(self, end_block=None):
+
+        logr.info(f"👀 Following from block {self.last_block + 1}, polling every {self.poll_interval}s")
+
+        # Blocks read before following started can be reorged out too.
+        self.remember(self.last_block + 1 - self.reorg_depth, self.last_block)
+
+        while end_block is None or self.last_block < end_block:
+
+            started = time.monotonic()
+
+            yield from self.poll(end_block)
+
+            time.sleep(max(0, self.poll_interval - (time.monotonic() - started)))
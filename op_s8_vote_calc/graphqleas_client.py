@@ -1,12 +1,41 @@
 
-import requests as r
+import os
+import time
+import logging
 from typing import List
 from pprint import pprint
 
+from .connections import pool
+
+logr = logging.getLogger(__name__)
+
+def resolve_page_sizes():
+
+    try:
+        page_size = int(os.getenv('S8_EAS_PAGE_SIZE', 100))
+        assert page_size > 0
+    except:
+        page_size = 100
+
+    try:
+        max_page_size = int(os.getenv('S8_EAS_MAX_PAGE_SIZE', 1000))
+        assert max_page_size >= page_size
+    except:
+        max_page_size = max(1000, page_size)
+
+    return page_size, max_page_size
+
+ATTESTATION_FIELDS = ['id', 'ipfsHash', 'isOffchain', 'recipient', 'refUID', 'expirationTime', 'decodedDataJson', 'data', 'attester',
+                      'revocable', 'revocationTime', 'revoked', 'time', 'timeCreated', 'txid', 'schemaId']
+
 class EASGraphQLClient:
 
-    def __init__(self, url):
+    def __init__(self, url, target_seconds=1.0, min_page_size=10):
         self.url = url
+
+        self.page_size, self.max_page_size = resolve_page_sizes()
+        self.min_page_size = min(min_page_size, self.page_size)
+        self.target_seconds = target_seconds
     
     def get_schemas(self, schema_id) -> List:
         QUERY = """
@@ -29,53 +58,73 @@ class EASGraphQLClient:
         }
 
         # print(f"Hitting: {self.url}")
-        resp = r.post(self.url, json={'query': QUERY , 'variables': VARIABLES})
+        resp = pool.post(self.url, json={'query': QUERY , 'variables': VARIABLES})
         
         return [resp.json()['data']['getSchema']]
 
-    def get_attestations(self, schema_id):
+    def get_attestations(self, schema_id, since=None, fields=ATTESTATION_FIELDS, data_prefix=None):
+        """
+        Yield every attestation for a schema, in id order, with just the requested `fields`.
 
-        take = 100
-        skip = 0
+        With `since=(time_created, revocation_time)`, only attestations created or revoked at or
+        after those times are returned.  With `data_prefix`, only those whose hex encoded data starts
+        with it, eg. the votes for one proposal.
+
+        Pages are keyed on the last id seen (`id > cursor`) rather than a `skip` offset, so each page
+        costs the indexer the same no matter how deep into the schema it is.  The page size starts
+        at `self.page_size`, doubles while pages come back within `self.target_seconds`, and halves
+        when they are slow or fail.
+        """
+
+        take = self.page_size
+        cursor = None
 
         while True:
             QUERY = """
-                    query Attestations($where: AttestationWhereInput, $take: Int, $skip: Int) {
-                    attestations(where: $where, take: $take, skip: $skip) {
-                        id
-                        ipfsHash
-                        isOffchain
-                        recipient
-                        refUID
-                        expirationTime
-                        decodedDataJson
-                        data
-                        attester
-                        revocable
-                        revocationTime
-                        revoked
-                        time
-                        timeCreated
-                        txid
-                        schemaId
+                    query Attestations($where: AttestationWhereInput, $take: Int, $orderBy: [AttestationOrderByWithRelationInput!]) {
+                    attestations(where: $where, take: $take, orderBy: $orderBy) {
+                        %s
                     }
                     }
-                    """
+                    """ % "\n                        ".join(fields)
+            where = {"schemaId": { "equals": schema_id }}
+            if since is not None:
+                where["OR"] = [{"timeCreated": { "gte": since[0] }}, {"revocationTime": { "gte": since[1] }}]
+            if data_prefix is not None:
+                where["data"] = { "startsWith": data_prefix }
+            if cursor is not None:
+                where["id"] = { "gt": cursor }
+
             VARIABLES = {
-                "where": {
-                    "schemaId": { "equals": schema_id }
-                },
+                "where": where,
                 "take" : take,
-                "skip" : skip
+                "orderBy": [{"id": "asc"}]
             }
-            resp = r.post(self.url, json={'query': QUERY , 'variables': VARIABLES})
 
-            attestations = resp.json()['data']['attestations']
+            started = time.monotonic()
+
+            try:
+                resp = pool.post(self.url, json={'query': QUERY , 'variables': VARIABLES})
+                resp.raise_for_status()
+                attestations = resp.json()['data']['attestations']
+            except Exception as e:
+                if take <= self.min_page_size:
+                    raise e
+                take = max(take // 2, self.min_page_size)
+                logr.warning(f"⚠️ Attestation page failed ({e}), retrying with {take} per page")
+                continue
+
+            elapsed = time.monotonic() - started
 
             for attestation in attestations:
                 yield attestation
 
-            if len(attestations) == take:
-                skip = skip + take
-            else:
-                break
\ No newline at end of file
+            if len(attestations) < take:
+                break
+
+            cursor = attestations[-1]['id']
+
+            if elapsed < self.target_seconds:
+                take = min(take * 2, self.max_page_size)
+            elif elapsed > self.target_seconds * 2:
+                take = max(take // 2, self.min_page_size)
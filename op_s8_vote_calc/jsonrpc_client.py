@@ -2,15 +2,26 @@
 import json
 import os
 import logging
+import asyncio
+import threading
+import heapq
 
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 from web3 import Web3
 from web3.exceptions import Web3RPCError
+from eth_abi import encode, decode
+from eth_abi.registry import registry
+from eth_abi.decoding import ContextFramesBytesIO
+from eth_abi.grammar import parse
 from abifsm import ABISet, ABI
 
 from .utils import camel_to_snake
+from .connections import pool
+from .endpoints import is_range_error_object
 from .signatures import VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1
 
 logr = logging.getLogger(__name__)
@@ -36,6 +47,162 @@ def resolve_block_count_span(chain_id=None):
     
     return override or default_block_span
 
+def resolve_max_workers(max_workers=None):
+
+    try:
+        max_workers = int(max_workers or os.getenv('ARCHIVE_NODE_HTTP_MAX_WORKERS', 1))
+        assert max_workers > 0
+    except:
+        max_workers = 1
+
+    return max_workers
+
+def log_sort_key(log):
+    return (int(log['blockNumber']), int(log['transactionIndex']), int(log['logIndex']))
+
+def address_key(address):
+    """A hashable, printable key for one address or a multi-address eth_getLogs filter."""
+    if isinstance(address, (list, tuple)):
+        return ','.join(sorted(address))
+    return address
+
+def resolve_max_block_count_span(initial_span):
+
+    try:
+        ceiling = int(os.getenv('ARCHIVE_NODE_HTTP_MAX_BLOCK_COUNT_SPAN'))
+        assert ceiling > 0
+    except:
+        ceiling = None
+
+    return max(ceiling or initial_span * 16, initial_span)
+
+class BlockSpanController:
+    """
+    Learns how many blocks an endpoint will serve in one eth_getLogs call for a given contract, or
+    set of contracts.
+
+    Spans start at the seed from resolve_block_count_span, grow by `growth` each time a full-sized
+    window succeeds, and drop back whenever the provider refuses one or times out: to the largest
+    span it has already accepted if that is smaller, else to half of the rejected range.  The smallest rejected range becomes a ceiling the span stays under; after
+    `probe_after` straight successes at the ceiling it is lifted again, in case the refusal was
+    about a log-dense stretch of blocks rather than the span itself.
+    """
+
+    def __init__(self, growth=1.25, min_span=1, probe_after=64):
+        self.growth = growth
+        self.min_span = min_span
+        self.probe_after = probe_after
+
+        self.spans = {}
+        self.ceilings = {}
+        self.accepted = defaultdict(int)
+        self.streaks = defaultdict(int)
+
+        self.lock = threading.Lock()
+
+    def span(self, endpoint, address, initial_span):
+
+        address = address_key(address)
+        key = (endpoint, address)
+
+        with self.lock:
+            if key not in self.spans:
+                self.spans[key] = initial_span
+                self.ceilings[key] = resolve_max_block_count_span(initial_span) + 1
+                logr.info(f"📏 Starting with a {initial_span} block span for {address} on {endpoint}")
+            return self.spans[key]
+
+    def record_success(self, endpoint, address, span):
+
+        address = address_key(address)
+        key = (endpoint, address)
+
+        with self.lock:
+            current = self.spans.get(key)
+            if current is None:
+                return
+
+            self.accepted[key] = max(self.accepted[key], span)
+
+            if span < current:
+                return
+
+            ceiling = self.ceilings[key]
+
+            if current >= ceiling - 1:
+                self.streaks[key] += 1
+                if self.streaks[key] < self.probe_after:
+                    return
+                ceiling = self.ceilings[key] = max(int(ceiling * self.growth), ceiling + 1)
+                self.streaks[key] = 0
+
+            # Bisect towards the ceiling rather than overshooting it again.
+            new = min(max(int(current * self.growth), current + 1), max((self.accepted[key] + ceiling) // 2, current), ceiling - 1)
+            if new != current:
+                self.spans[key] = new
+                logr.debug(f"📏 Growing block span for {address} on {endpoint}: {current} -> {new}")
+
+    def record_failure(self, endpoint, address, span):
+
+        address = address_key(address)
+        key = (endpoint, address)
+
+        with self.lock:
+            current = self.spans.get(key, span)
+            self.ceilings[key] = min(self.ceilings.get(key, span), span)
+            self.streaks[key] = 0
+
+            if self.accepted[key] < span:
+                fallback = max(self.accepted[key], span // 2)
+            else:
+                fallback = span // 2
+            self.accepted[key] = min(self.accepted[key], fallback)
+
+            new = max(min(current, fallback), self.min_span)
+            if new != current:
+                self.spans[key] = new
+                logr.info(f"📏 Shrinking block span for {address} on {endpoint}: {current} -> {new}")
+
+    def report(self):
+
+        with self.lock:
+            for (endpoint, address), span in self.spans.items():
+                logr.info(f"📏 Learned block span for {address} on {endpoint}: {span}")
+
+def decoded_log_sort_key(log):
+    return (int(log['block_number']), int(log['transaction_index']), int(log['log_index']))
+
+async def async_merge(streams, key):
+    """heapq.merge for async iterators that are each already sorted by `key`."""
+
+    heap = []
+
+    for idx, stream in enumerate(streams):
+        try:
+            item = await stream.__anext__()
+        except StopAsyncIteration:
+            continue
+        heap.append((key(item), idx, item))
+
+    heapq.heapify(heap)
+
+    while heap:
+        _, idx, item = heap[0]
+        yield item
+
+        try:
+            item = await streams[idx].__anext__()
+        except StopAsyncIteration:
+            heapq.heappop(heap)
+            continue
+        heapq.heapreplace(heap, (key(item), idx, item))
+
+def is_block_range_error(e):
+    """True if a Web3RPCError is the provider rejecting the size of an eth_getLogs range."""
+    error_dict = eval(str(e.args[0]))  # Convert string representation to dict
+    api_error_code = error_dict['code']
+    return api_error_code == -32600 or api_error_code == -32602 or is_range_error_object(error_dict)
+
 class SubscriptionPlannerMixin:
 
     def init(self):
@@ -60,6 +227,94 @@ class SubscriptionPlannerMixin:
         else:
             raise Exception(f"Unknown signal type: {signal_type}")
 
+def bytes_to_str(x):
+    if isinstance(x, bytes):
+        return x.hex()
+    return x
+
+def array_of_bytes_to_str(x):
+    if isinstance(x, list):
+        return [bytes_to_str(i) for i in x]
+    elif isinstance(x, bytes):
+        return bytes_to_str(x)
+    return x
+
+class CompiledEventDecoder:
+    """
+    Decodes one event's raw logs straight from `topics` and `data` with eth_abi.
+
+    Everything that doesn't depend on the log - the snake_case field names, the indexed/non-indexed
+    split, the eth_abi decoders and the per-field post-processing - is worked out once from the ABI
+    fragment, instead of going through web3's process_log and camel_to_snake for every log.
+
+    The output matches the web3-based casters it replaces: addresses are checksummed (or lowercased,
+    for `lower_addresses`), arrays come back as lists, and with `hex_bytes` bytes become hex strings.
+    """
+
+    def __init__(self, abi_literal, hex_bytes=True, lower_addresses=False):
+
+        inputs = abi_literal['inputs']
+
+        self.topic_count = 1 + len([i for i in inputs if i.get('indexed')])
+
+        # Indexed dynamic values are only present as their keccak hash.
+        self.topic_fields = [(camel_to_snake(i['name']), registry.get_tuple_decoder('bytes32' if parse(i['type']).is_dynamic else i['type']))
+                             for i in inputs if i.get('indexed')]
+
+        data_inputs = [i for i in inputs if not i.get('indexed')]
+        self.data_names = [camel_to_snake(i['name']) for i in data_inputs]
+        self.data_decoder = registry.get_tuple_decoder(*[i['type'] for i in data_inputs])
+
+        self.fields = [(camel_to_snake(i['name']), self.compile_cast(i['type'], i.get('indexed', False), hex_bytes, lower_addresses)) for i in inputs]
+
+    @staticmethod
+    def compile_cast(abi_type, indexed, hex_bytes, lower_addresses):
+
+        abi_type = parse(abi_type)
+
+        if indexed and abi_type.is_dynamic:
+            return bytes_to_str if hex_bytes else None
+
+        if abi_type.is_array:
+            item_type = abi_type.item_type
+            while item_type.is_array:
+                item_type = item_type.item_type
+
+            if item_type.base == 'address':
+                to_address = str.lower if lower_addresses else Web3.to_checksum_address
+                return lambda x: [to_address(i) for i in x]
+            if item_type.base == 'bytes' and hex_bytes:
+                return lambda x: array_of_bytes_to_str(list(x))
+            return list
+
+        if abi_type.base == 'address':
+            return str.lower if lower_addresses else Web3.to_checksum_address
+
+        if abi_type.base == 'bytes' and hex_bytes:
+            return bytes_to_str
+
+        return None
+
+    def __call__(self, log):
+
+        topics = log['topics']
+
+        if len(topics) != self.topic_count:
+            raise Exception(f"Expected {self.topic_count} log topics.  Got {len(topics)}")
+
+        values = {}
+
+        for (name, decoder), topic in zip(self.topic_fields, topics[1:]):
+            values[name] = decoder(ContextFramesBytesIO(bytes(topic)))[0]
+
+        for name, value in zip(self.data_names, self.data_decoder(ContextFramesBytesIO(bytes(log['data'])))):
+            values[name] = value
+
+        return {name : cast(values[name]) if cast else values[name] for name, cast in self.fields}
+
+    def decode_batch(self, logs):
+        return [self(log) for log in logs]
+
 class JsonRpcHistHttpClientCaster:
     
     def __init__(self, abis):
@@ -70,12 +325,19 @@ class JsonRpcHistHttpClientCaster:
         abi_frag = self.abis.get_by_signature(signature)
         if abi_frag is None:
             raise Exception(f"Unknown signature: {signature}")
+
+        is_vote = signature in (VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1)
+
+        # eth_abi can decode tuples too, but web3 turns them into dicts, so leave those to process_log.
+        if not any(i['type'].startswith('tuple') for i in abi_frag.literal['inputs']):
+            return CompiledEventDecoder(abi_frag.literal, hex_bytes=not is_vote, lower_addresses=is_vote)
+
         EVENT_NAME = abi_frag.name       
         contract_events = Web3().eth.contract(abi=[abi_frag.literal]).events
         processor = getattr(contract_events, EVENT_NAME)().process_log
 
         
-        if signature in (VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1):
+        if is_vote:
         
             def caster_fn(log):
                 tmp = processor(log)
@@ -85,18 +347,6 @@ class JsonRpcHistHttpClientCaster:
     
         else: 
 
-            def bytes_to_str(x):
-                if isinstance(x, bytes):
-                    return x.hex()
-                return x
-
-            def array_of_bytes_to_str(x):
-                if isinstance(x, list):
-                    return [bytes_to_str(i) for i in x]
-                elif isinstance(x, bytes):
-                    return bytes_to_str(x)
-                return x
-
             def caster_fn(log):
                 tmp = processor(log)
                 args = {camel_to_snake(k) : array_of_bytes_to_str(v) for k,v in tmp['args'].items()}
@@ -106,8 +356,11 @@ class JsonRpcHistHttpClientCaster:
 
 class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
 
-    def __init__(self, url):
+    def __init__(self, url, max_workers=None, log_cache=None):
         self.url = url
+        self.max_workers = resolve_max_workers(max_workers)
+        self.span_controller = BlockSpanController()
+        self.log_cache = log_cache
         
         self.init()
 
@@ -118,7 +371,7 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
 
     def connect(self):
         
-        return Web3(Web3.HTTPProvider(self.url))
+        return pool.web3(self.url, self.max_workers)
 
     def plan_event(self, chain_id, address, signature):
 
@@ -151,7 +404,23 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
         return ans
     
 
-    def get_paginated_logs(self, w3, contract_address, topics, step, start_block, end_block=None):
+    def get_paginated_logs(self, w3, contract_address, topics, step, start_block, end_block=None, chain_id=None):
+
+        return list(self.iter_paginated_logs(w3, contract_address, topics, step, start_block, end_block, chain_id))
+
+    def iter_paginated_logs(self, w3, contract_address, topics, step, start_block, end_block=None, chain_id=None):
+        """
+        Yield logs for a contract (or a list of contracts), window by window, in (block, tx_index, log_index) order.
+
+        Every window/topic-chunk pair is one eth_getLogs request.  Up to `self.max_workers` of those
+        run at once, and no more than `self.max_workers` windows are buffered ahead of the one being
+        yielded, so memory stays bounded no matter how far apart start_block and end_block are.
+
+        `step` only seeds the span controller; each new window is sized with whatever span it has
+        learned for this endpoint and contract so far.
+
+        Given a `chain_id` and a `self.log_cache`, finalized parts of each window are served from disk.
+        """
 
         def chunk_list(lst, chunk_size):
             """Split a list into chunks of size `chunk_size`."""
@@ -159,48 +428,90 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
 
         topics = chunk_list(list(topics), chunk_size=4)
 
-        logr.info(f"👉 Fetching {len(topics)} topic chunk(s) for {contract_address} from block {start_block}")
+        logr.info(f"👉 Fetching {len(topics)} topic chunk(s) for {address_key(contract_address)} from block {start_block} with {self.max_workers} worker(s)")
+
+        if end_block is None:
+            end_block = w3.eth.block_number
+
+        finalized_block = self.finalized_block(w3) if self.log_cache is not None and chain_id is not None else None
 
         from_block = start_block
 
-        all_logs = []
+        pending = deque()
 
-        while True:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
 
-            logs = []
+            while from_block <= end_block or pending:
+
+                while from_block <= end_block and len(pending) < self.max_workers:
+
+                    span = self.span_controller.span(self.url, contract_address, step)
+
+                    to_block = min(from_block + span - 1, end_block)  # Ensure we don't exceed the end_block
+
+                    futures = [executor.submit(self.get_cached_logs_by_block_range, w3, chain_id, contract_address, topic_chunk, from_block, to_block, finalized_block) for topic_chunk in topics]
+                    pending.append((from_block, to_block, futures))
+
+                    from_block = to_block + 1
+
+                window_from_block, window_to_block, futures = pending.popleft()
+
+                logs = []
+                for future in futures:
+                    logs.extend(future.result())
+
+                logs.sort(key=log_sort_key)
+
+                if len(logs):
+                    logr.info(f"Fetched {len(logs)} logs from block {window_from_block} to {window_to_block}")
+
+                yield from logs
+
+    def finalized_block(self, w3):
+
+        try:
+            return w3.eth.get_block('finalized')['number']
+        except Exception:
+            return w3.eth.block_number - self.log_cache.finality_depth
+
+    def get_cached_logs_by_block_range(self, w3, chain_id, contract_address, event_signature_hash, from_block, to_block, finalized_block=None):
+        """
+        :py:meth:`get_logs_by_block_range`, served from `self.log_cache` where possible.
+
+        Only the part of the range at or below `finalized_block` is looked up or stored; anything
+        newer always goes to the provider.
+        """
 
-            if end_block is None:
-                end_block = w3.eth.block_number
+        if self.log_cache is None or finalized_block is None or from_block > finalized_block:
+            return self.get_logs_by_block_range(w3, contract_address, event_signature_hash, from_block, to_block)
 
-            to_block = min(from_block + step - 1, end_block)  # Ensure we don't exceed the end_block
+        cacheable_to_block = min(to_block, finalized_block)
 
-            for topic_chunk in topics:
-                chunk_logs = self.get_logs_by_block_range(w3, contract_address, topic_chunk, from_block, to_block)
-                logs.extend(chunk_logs)
-            
-            if len(logs):
-                logr.info(f"Fetched {len(logs)} logs from block {from_block} to {to_block}")
-            
-            all_logs.extend(logs)
+        logs, gaps = self.log_cache.lookup(chain_id, contract_address, event_signature_hash, from_block, cacheable_to_block)
 
-            from_block = to_block + 1
+        for gap_from_block, gap_to_block in gaps:
+            gap_logs = self.get_logs_by_block_range(w3, contract_address, event_signature_hash, gap_from_block, gap_to_block)
+            self.log_cache.store(chain_id, contract_address, event_signature_hash, gap_from_block, gap_to_block, gap_logs)
+            logs.extend(gap_logs)
 
-            if from_block > end_block:
-                break
+        if to_block > cacheable_to_block:
+            logs.extend(self.get_logs_by_block_range(w3, contract_address, event_signature_hash, cacheable_to_block + 1, to_block))
 
-        return all_logs
+        return logs
 
     def get_logs_by_block_range(self, w3, contract_address, event_signature_hash, from_block, to_block,
                                 current_recursion_depth=0, max_recursion_depth=2000):
         """
-        This is a recursive function that will split itself apart to handle block ranges that exceed the block limit of the external API.
+        This is a recursive function that will split itself apart to handle block ranges that exceed the block limit of the external API,
+        or that time out.  Every rejection and every success is reported to `self.span_controller`, so later windows are sized from what
+        the provider actually accepted.
 
         It is unlikely that this function will ever be called directly, and is instead called by
             the :py:meth:`~.clients.JsonRpcHistHttpClient.get_paginated_logs` function, where additional
             processing is performed.
 
         :param w3: The web3 object used to interact with the external API.
-        :param contract_address: The address of the contract to which the event is emitted.
+        :param contract_address: The address of the contract to which the event is emitted, or a list of addresses.
         :param event_signature_hash: The hash of the event signature.
         :param from_block: The starting block number for the block range.
         :param to_block: The ending block number for the block range.
@@ -221,216 +532,614 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
             logs = w3.eth.get_logs(event_filter)
         except Exception as e:
             # catch and attempt to recover block limitation ranges
-            if isinstance(e, Web3RPCError):
-                error_dict = eval(str(e.args[0]))  # Convert string representation to dict
-                api_error_code = error_dict['code']
-                if api_error_code == -32600 or api_error_code == -32602:
-                    # add one to recursion depth
-                    new_recursion_depth = current_recursion_depth + 1
-                    # split block range in half
-                    mid = (from_block + to_block) // 2
-                    # Get results from both recursive calls
-                    first_half = self.get_logs_by_block_range(
-                        w3=w3,
-                        from_block=from_block,
-                        to_block=mid - 1,
-                        contract_address=contract_address,
-                        event_signature_hash=event_signature_hash,
-                        current_recursion_depth=new_recursion_depth,
-                        max_recursion_depth=max_recursion_depth
-                    )
-
-                    second_half = self.get_logs_by_block_range(
-                        w3=w3,
-                        from_block=mid,
-                        to_block=to_block,
-                        contract_address=contract_address,
-                        event_signature_hash=event_signature_hash,
-                        current_recursion_depth=new_recursion_depth,
-                        max_recursion_depth=max_recursion_depth
-                    )
-
-                    # Combine results, handling potential None values
-                    logs = []
-                    if first_half is not None:
-                        logs.extend(first_half)
-                    if second_half is not None:
-                        logs.extend(second_half)
-                    return logs
+            if (isinstance(e, Web3RPCError) and is_block_range_error(e)) or isinstance(e, requests.exceptions.Timeout):
+
+                if from_block >= to_block:
+                    raise e
+
+                self.span_controller.record_failure(self.url, contract_address, to_block - from_block + 1)
+
+                # add one to recursion depth
+                new_recursion_depth = current_recursion_depth + 1
+                # split block range in half
+                mid = (from_block + to_block + 1) // 2
+                # Get results from both recursive calls
+                first_half = self.get_logs_by_block_range(
+                    w3=w3,
+                    from_block=from_block,
+                    to_block=mid - 1,
+                    contract_address=contract_address,
+                    event_signature_hash=event_signature_hash,
+                    current_recursion_depth=new_recursion_depth,
+                    max_recursion_depth=max_recursion_depth
+                )
+
+                second_half = self.get_logs_by_block_range(
+                    w3=w3,
+                    from_block=mid,
+                    to_block=to_block,
+                    contract_address=contract_address,
+                    event_signature_hash=event_signature_hash,
+                    current_recursion_depth=new_recursion_depth,
+                    max_recursion_depth=max_recursion_depth
+                )
+
+                # Combine results, handling potential None values
+                logs = []
+                if first_half is not None:
+                    logs.extend(first_half)
+                if second_half is not None:
+                    logs.extend(second_half)
+                return logs
             # Fallback to raising the exception
             raise e
+
+        self.span_controller.record_success(self.url, contract_address, to_block - from_block + 1)
+
         return logs
 
 
-    def read(self, from_block, to_block):
+    def decode_log(self, chain_id, cs_address, log):
+
+        topic = "0x" + log['topics'][0].hex()
+
+        caster_fn, signature = self.event_subsription_meta[chain_id][cs_address][topic]
+
+        args = caster_fn(log)
+
+        out = {}
+
+        out['block_number'] = str(log['blockNumber'])
+        out['transaction_index'] = log['transactionIndex']
+        out['log_index'] = log['logIndex']
+
+        out.update(**args)
+        
+        out['signature'] = signature
+        out['sighash'] = topic.replace("0x", "")
+
+        return out
+
+    def planned_topics(self, chain_id, address, signatures=None):
+        """Planned {topic: signature} for an address, optionally narrowed to `signatures`."""
+
+        cs_address = Web3.to_checksum_address(address)
+
+        return {topic : signature for topic, (caster_fn, signature) in self.event_subsription_meta[chain_id][cs_address].items()
+                if signatures is None or signature in signatures}
+
+    def planned_filter(self, chain_id, signatures=None):
+        """
+        Every planned address and topic on a chain, as one multi-address eth_getLogs filter.
+
+        Returns the sorted addresses, the sorted union of their topics, and the (address, topic)
+        routes that were actually planned, since the filter also matches pairs that weren't.
+        """
+
+        routes = set()
+
+        for cs_address in self.event_subsription_meta[chain_id].keys():
+            for topic in self.planned_topics(chain_id, cs_address, signatures):
+                routes.add((cs_address, topic))
+
+        addresses = sorted({cs_address for cs_address, topic in routes})
+        topics = sorted({topic for cs_address, topic in routes})
+
+        return addresses, topics, routes
+
+    def route_log(self, routes, log):
+        """The planned (address, topic) a log belongs to, or None if the filter only matched it by accident."""
+
+        route = (Web3.to_checksum_address(log['address']), "0x" + log['topics'][0].hex())
+
+        return route if route in routes else None
+
+    def iter_decoded_logs(self, chain_id, routes, logs):
+
+        for log in logs:
+            route = self.route_log(routes, log)
+            if route is not None:
+                yield self.decode_log(chain_id, route[0], log)
+
+    def read(self, from_block, to_block, signatures=None):
+        """
+        Stream decoded logs for everything planned, in (block, tx_index, log_index) order.
+
+        All planned addresses and topics on a chain are fetched together, with one multi-address
+        eth_getLogs filter per window, and each log is routed to its caster by (address, topic).
+        Adding a contract to the plan therefore costs no extra round trips.  Each chain's stream is
+        already in block order, so the streams are merged with a heap.
+        """
 
         w3 = self.connect()
 
-        all_logs = []
+        streams = []
 
-        new_signal = True
         for chain_id in self.event_subsription_meta.keys():
 
             step = resolve_block_count_span(chain_id)
 
-            for cs_address in self.event_subsription_meta[chain_id].keys():
+            addresses, topics, routes = self.planned_filter(chain_id, signatures)
+
+            if not routes:
+                continue
+
+            logs = self.iter_paginated_logs(w3, addresses, topics, step, from_block, to_block, chain_id)
 
-                topics = self.event_subsription_meta[chain_id][cs_address].keys()
+            streams.append(self.iter_decoded_logs(chain_id, routes, logs))
 
-                logs = self.get_paginated_logs(w3, cs_address, topics, step, from_block, to_block)
+        yield from heapq.merge(*streams, key=decoded_log_sort_key)
+
+        self.span_controller.report()
+        pool.endpoint_pool(self.url).report()
+
+        if self.log_cache is not None:
+            self.log_cache.report()
+
+
+class JsonRpcHistAsyncHttpClient(JsonRpcHistHttpClient):
+    """
+    asyncio flavour of JsonRpcHistHttpClient.
+
+    Planning, casting and decoding are shared with the blocking client; only the transport differs.
+    eth_getLogs goes out over one pooled aiohttp session (see connections.py), with at most `max_workers` requests in flight,
+    and `read()` is an async generator, so one event loop can keep many ranges in flight while
+    other downloads share the same loop.
+    """
+
+    async def connect(self):
+
+        return await pool.async_web3(self.url, self.max_workers)
+
+    async def is_valid(self):
+
+        if self.url in ('', 'ignored', None):
+            ans = False
+        else:
+            w3 = await self.connect()
+            ans = await w3.is_connected()
+            await w3.provider.disconnect()
+        
+        if ans:
+            print(f"The server '{self.url}' is valid.")
+        else:
+            print(f"The server '{self.url}' is not valid.")
+        
+        return ans
+
+    async def get_paginated_logs(self, w3, contract_address, topics, step, start_block, end_block=None, chain_id=None):
+
+        return [log async for log in self.iter_paginated_logs(w3, contract_address, topics, step, start_block, end_block, chain_id)]
+
+    async def iter_paginated_logs(self, w3, contract_address, topics, step, start_block, end_block=None, chain_id=None):
+
+        def chunk_list(lst, chunk_size):
+            """Split a list into chunks of size `chunk_size`."""
+            return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+
+        topics = chunk_list(list(topics), chunk_size=4)
+
+        logr.info(f"👉 Fetching {len(topics)} topic chunk(s) for {address_key(contract_address)} from block {start_block} with {self.max_workers} worker(s)")
+
+        if end_block is None:
+            end_block = await w3.eth.block_number
+
+        finalized_block = await self.finalized_block(w3) if self.log_cache is not None and chain_id is not None else None
+
+        from_block = start_block
+
+        pending = deque()
+
+        try:
+            while from_block <= end_block or pending:
+
+                while from_block <= end_block and len(pending) < self.max_workers:
+
+                    span = self.span_controller.span(self.url, contract_address, step)
+
+                    to_block = min(from_block + span - 1, end_block)  # Ensure we don't exceed the end_block
+
+                    tasks = [asyncio.ensure_future(self.get_cached_logs_by_block_range(w3, chain_id, contract_address, topic_chunk, from_block, to_block, finalized_block)) for topic_chunk in topics]
+                    pending.append((from_block, to_block, tasks))
+
+                    from_block = to_block + 1
+
+                window_from_block, window_to_block, tasks = pending.popleft()
+
+                logs = []
+                for chunk_logs in await asyncio.gather(*tasks):
+                    logs.extend(chunk_logs)
+
+                logs.sort(key=log_sort_key)
+
+                if len(logs):
+                    logr.info(f"Fetched {len(logs)} logs from block {window_from_block} to {window_to_block}")
 
                 for log in logs:
+                    yield log
+        finally:
+            for _, _, tasks in pending:
+                for task in tasks:
+                    task.cancel()
+
+    async def finalized_block(self, w3):
+
+        try:
+            return (await w3.eth.get_block('finalized'))['number']
+        except Exception:
+            return (await w3.eth.block_number) - self.log_cache.finality_depth
+
+    async def get_cached_logs_by_block_range(self, w3, chain_id, contract_address, event_signature_hash, from_block, to_block, finalized_block=None):
+
+        if self.log_cache is None or finalized_block is None or from_block > finalized_block:
+            return await self.get_logs_by_block_range(w3, contract_address, event_signature_hash, from_block, to_block)
+
+        cacheable_to_block = min(to_block, finalized_block)
+
+        # The cache reads and writes gzipped JSON files, so that happens on the default executor's
+        # threads rather than on the loop, where it would hold up every request in flight.
+        loop = asyncio.get_running_loop()
+
+        logs, gaps = await loop.run_in_executor(None, self.log_cache.lookup, chain_id, contract_address, event_signature_hash, from_block, cacheable_to_block)
+
+        for gap_from_block, gap_to_block in gaps:
+            gap_logs = await self.get_logs_by_block_range(w3, contract_address, event_signature_hash, gap_from_block, gap_to_block)
+            await loop.run_in_executor(None, self.log_cache.store, chain_id, contract_address, event_signature_hash, gap_from_block, gap_to_block, gap_logs)
+            logs.extend(gap_logs)
+
+        if to_block > cacheable_to_block:
+            logs.extend(await self.get_logs_by_block_range(w3, contract_address, event_signature_hash, cacheable_to_block + 1, to_block))
+
+        return logs
+
+    async def get_logs_by_block_range(self, w3, contract_address, event_signature_hash, from_block, to_block,
+                                      current_recursion_depth=0, max_recursion_depth=2000):
+        """
+        Async twin of :py:meth:`JsonRpcHistHttpClient.get_logs_by_block_range`; both halves of a split range are fetched concurrently.
+        """
+
+        event_filter = {
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": contract_address,
+            "topics": [event_signature_hash]
+        }
+
+        try:
+            logs = await w3.eth.get_logs(event_filter)
+        except (Web3RPCError, asyncio.TimeoutError) as e:
+            if isinstance(e, Web3RPCError) and not is_block_range_error(e):
+                raise e
+
+            if from_block >= to_block:
+                raise e
 
+            self.span_controller.record_failure(self.url, contract_address, to_block - from_block + 1)
 
-                    topic = "0x" + log['topics'][0].hex()
+            new_recursion_depth = current_recursion_depth + 1
+            mid = (from_block + to_block + 1) // 2
 
-                    caster_fn, signature = self.event_subsription_meta[chain_id][cs_address][topic]
+            halves = await asyncio.gather(
+                self.get_logs_by_block_range(w3, contract_address, event_signature_hash, from_block, mid - 1,
+                                             new_recursion_depth, max_recursion_depth),
+                self.get_logs_by_block_range(w3, contract_address, event_signature_hash, mid, to_block,
+                                             new_recursion_depth, max_recursion_depth)
+            )
 
-                    args = caster_fn(log)
+            logs = []
+            for half in halves:
+                if half is not None:
+                    logs.extend(half)
+            return logs
 
-                    out = {}
+        self.span_controller.record_success(self.url, contract_address, to_block - from_block + 1)
+
+        return logs
 
-                    out['block_number'] = str(log['blockNumber'])
-                    out['transaction_index'] = log['transactionIndex']
-                    out['log_index'] = log['logIndex']
+    async def iter_decoded_logs(self, chain_id, routes, logs):
 
-                    out.update(**args)
-                    
-                    out['signature'] = signature
-                    out['sighash'] = topic.replace("0x", "")
+        async for log in logs:
+            route = self.route_log(routes, log)
+            if route is not None:
+                yield self.decode_log(chain_id, route[0], log)
 
-                    all_logs.append(out)
+    async def read(self, from_block, to_block, signatures=None):
 
-        all_logs.sort(key=lambda x: (x['block_number'], x['transaction_index'], x['log_index']))   
+        w3 = await self.connect()
 
-        for log in all_logs:
-            yield log
+        streams = []
+
+        try:
+            for chain_id in self.event_subsription_meta.keys():
+
+                step = resolve_block_count_span(chain_id)
+
+                addresses, topics, routes = self.planned_filter(chain_id, signatures)
+
+                if not routes:
+                    continue
+
+                logs = self.iter_paginated_logs(w3, addresses, topics, step, from_block, to_block, chain_id)
+
+                streams.append(self.iter_decoded_logs(chain_id, routes, logs))
+
+            async for log in async_merge(streams, key=decoded_log_sort_key):
+                yield log
+        finally:
+            await w3.provider.disconnect()
+
+        self.span_controller.report()
+        pool.endpoint_pool(self.url).report()
+
+        if self.log_cache is not None:
+            self.log_cache.report()
+
+
+QUORUM_ABI = {
+    "constant": True,
+    "inputs": [{"name": "proposal_id", "type": "uint256"}],
+    "name": "quorum",
+    "outputs": [{"name": "", "type": "uint256"}],
+    "payable": False,
+    "stateMutability": "view",
+    "type": "function"
+}
+
+VOTABLE_SUPPLY_ABI = {
+    "constant": True,
+    "inputs": [{"name": "block_number", "type": "uint256"}],
+    "name": "votableSupply",
+    "outputs": [{"name": "", "type": "uint256"}],
+    "payable": False,
+    "stateMutability": "view",
+    "type": "function"
+}
+
+COUNTING_MODE_ABI = {
+    "constant": True,
+    "inputs": [],
+    "name": "COUNTING_MODE",
+    "outputs": [{"name": "", "type": "string"}],
+    "payable": False,
+    "stateMutability": "view",
+    "type": "function"
+}
+
+PROPOSAL_TYPES_ABI = {
+    "inputs": [
+        {
+            "internalType": "uint8",
+            "name": "proposalTypeId",
+            "type": "uint8"
+        }
+    ],
+    "name": "proposalTypes",
+    "outputs": [
+        {
+            "components": [
+                {
+                    "internalType": "uint16",
+                    "name": "quorum",
+                    "type": "uint16"
+                },
+                {
+                    "internalType": "uint16",
+                    "name": "approvalThreshold",
+                    "type": "uint16"
+                },
+                {
+                    "internalType": "string",
+                    "name": "name",
+                    "type": "string"
+                },
+                {
+                    "internalType": "string",
+                    "name": "description",
+                    "type": "string"
+                },
+                {
+                    "internalType": "address",
+                    "name": "module",
+                    "type": "address"
+                }
+            ],
+            "internalType": "struct IProposalTypesConfigurator.ProposalType",
+            "name": "",
+            "type": "tuple"
+        }
+    ],
+    "stateMutability": "view",
+    "type": "function"
+}
 
+def abi_type_str(abi_io):
+    if abi_io['type'].startswith('tuple'):
+        return '(' + ','.join(abi_type_str(c) for c in abi_io['components']) + ')' + abi_io['type'][len('tuple'):]
+    return abi_io['type']
+
+def resolve_batch_size(batch_size=None):
+
+    try:
+        batch_size = int(batch_size or os.getenv('S8_JSON_RPC_BATCH_SIZE', 100))
+        assert batch_size > 0
+    except:
+        batch_size = 100
+
+    return batch_size
+
+def to_proposal_type_info(proposal_type_info):
+    return {
+        'quorum_bps': proposal_type_info[0],
+        'approval_threshold_bps': proposal_type_info[1],
+        'name': proposal_type_info[2],
+        'description': proposal_type_info[3],
+        'module': proposal_type_info[4]
+        }
 
 class JsonRpcContractCalls:
 
     def __init__(self, w3):
         self.w3 = w3
+
+        self.contracts = {}
+
+    def contract(self, address, abi):
+
+        key = (address, abi['name'])
+
+        if key not in self.contracts:
+            self.contracts[key] = self.w3.eth.contract(address=address, abi=[abi])
+
+        return self.contracts[key]
     
     def get_quorum(self, gov_address, onchain_proposal_id):
 
-        contract_abi = [
-            {
-                "constant": True,
-                "inputs": [{"name": "proposal_id", "type": "uint256"}],
-                "name": "quorum",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-
-        # Create a contract instance
-        contract = self.w3.eth.contract(address=gov_address, abi=contract_abi)
+        contract = self.contract(gov_address, QUORUM_ABI)
         return contract.functions.quorum(int(onchain_proposal_id)).call()
     
     def get_votable_supply(self, gov_address, start_block_number):
 
-        contract_abi = [
-            {
-                "constant": True,
-                "inputs": [{"name": "block_number", "type": "uint256"}],
-                "name": "votableSupply",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-
-        # Create a contract instance
-        contract = self.w3.eth.contract(address=gov_address, abi=contract_abi)
+        contract = self.contract(gov_address, VOTABLE_SUPPLY_ABI)
 
         self.votable_supply = contract.functions.votableSupply(int(start_block_number)).call()
         return self.votable_supply
 
     def get_counting_mode(self, gov_address, start_block_number):
 
-        contract_abi = [
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "COUNTING_MODE",
-                "outputs": [{"name": "", "type": "string"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-
-        contract = self.w3.eth.contract(address=gov_address, abi=contract_abi)
+        contract = self.contract(gov_address, COUNTING_MODE_ABI)
 
         self.counting_mode = contract.functions.COUNTING_MODE().call(block_identifier=start_block_number)
         return self.counting_mode
 
     def get_proposal_type_info(self, ptc_address, proposal_type_id, start_block_number):
 
-        contract_abi = [
-            {
-                "inputs": [
-                    {
-                        "internalType": "uint8",
-                        "name": "proposalTypeId",
-                        "type": "uint8"
-                    }
-                ],
-                "name": "proposalTypes",
-                "outputs": [
-                    {
-                        "components": [
-                            {
-                                "internalType": "uint16",
-                                "name": "quorum",
-                                "type": "uint16"
-                            },
-                            {
-                                "internalType": "uint16",
-                                "name": "approvalThreshold",
-                                "type": "uint16"
-                            },
-                            {
-                                "internalType": "string",
-                                "name": "name",
-                                "type": "string"
-                            },
-                            {
-                                "internalType": "string",
-                                "name": "description",
-                                "type": "string"
-                            },
-                            {
-                                "internalType": "address",
-                                "name": "module",
-                                "type": "address"
-                            }
-                        ],
-                        "internalType": "struct IProposalTypesConfigurator.ProposalType",
-                        "name": "",
-                        "type": "tuple"
-                    }
-                ],
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-
-
-        contract = self.w3.eth.contract(address=ptc_address, abi=contract_abi)
+        contract = self.contract(ptc_address, PROPOSAL_TYPES_ABI)
 
         proposal_type_info = contract.functions.proposalTypes(int(proposal_type_id)).call() #block_identifier=start_block_number)
         
-        proposal_type_info = {
-            'quorum_bps': proposal_type_info[0],
-            'approval_threshold_bps': proposal_type_info[1],
-            'name': proposal_type_info[2],
-            'description': proposal_type_info[3],
-            'module': proposal_type_info[4]
-            }
-
-        return proposal_type_info
+        return to_proposal_type_info(proposal_type_info)
+
+    def batch(self, batch_size=None):
+        return JsonRpcContractCallBatch(self.w3, batch_size)
+
+
+class PendingCall:
+    """The eventual result of one call queued on a JsonRpcContractCallBatch."""
+
+    def __init__(self, request_id, decode):
+        self.request_id = request_id
+        self.decode = decode
+
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def result(self):
+
+        if not self.done:
+            raise Exception("Batch has not been executed yet.")
+
+        if self.error is not None:
+            raise Exception(f"eth_call failed: {self.error}")
+
+        return self.value
+
+
+class JsonRpcContractCallBatch:
+    """
+    Queues the same calls as JsonRpcContractCalls, and sends them as JSON-RPC batch payloads.
+
+    Each get_* method returns a PendingCall straight away; `execute()` posts the queued eth_calls in
+    batches of `batch_size` and resolves them.  Identical calls (same contract, calldata and block)
+    are only sent once, which matters for things like COUNTING_MODE that every proposal asks for.
+    """
+
+    def __init__(self, w3, batch_size=None):
+        self.w3 = w3
+        self.batch_size = resolve_batch_size(batch_size)
+
+        self.requests = {}
+        self.pending = []
+
+    def queue(self, address, abi, args, block_identifier='latest', transform=None):
+
+        input_types = [abi_type_str(i) for i in abi['inputs']]
+        output_types = [abi_type_str(o) for o in abi['outputs']]
+
+        selector = Web3.keccak(text=f"{abi['name']}({','.join(input_types)})")[:4]
+        data = '0x' + (selector + encode(input_types, args)).hex()
+
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+
+        key = (address.lower(), data, block_identifier)
+
+        if key not in self.requests:
+            self.requests[key] = len(self.requests)
+
+        def decode_result(raw):
+            value = decode(output_types, bytes.fromhex(raw.replace("0x", "")))[0]
+            return transform(value) if transform else value
+
+        call = PendingCall(self.requests[key], decode_result)
+        self.pending.append(call)
+        return call
+
+    def get_quorum(self, gov_address, onchain_proposal_id):
+        return self.queue(gov_address, QUORUM_ABI, [int(onchain_proposal_id)])
+
+    def get_votable_supply(self, gov_address, start_block_number):
+        return self.queue(gov_address, VOTABLE_SUPPLY_ABI, [int(start_block_number)])
+
+    def get_counting_mode(self, gov_address, start_block_number):
+        return self.queue(gov_address, COUNTING_MODE_ABI, [], block_identifier=int(start_block_number))
+
+    def get_proposal_type_info(self, ptc_address, proposal_type_id, start_block_number):
+
+        def transform(proposal_type_info):
+            proposal_type_info = list(proposal_type_info)
+            proposal_type_info[4] = Web3.to_checksum_address(proposal_type_info[4])
+            return to_proposal_type_info(proposal_type_info)
+
+        return self.queue(ptc_address, PROPOSAL_TYPES_ABI, [int(proposal_type_id)], transform=transform) #block_identifier=start_block_number)
+
+    def post(self, payload):
+
+        # Goes through the provider, so batches get the same endpoint routing and retries as single calls.
+        answer = self.w3.provider.make_batch_request([(request['method'], request['params']) for request in payload])
+
+        if isinstance(answer, dict):
+            return answer
+
+        # web3 numbers the requests itself and hands the responses back in request order.
+        return [dict(response, id=request['id']) for request, response in zip(payload, answer)]
+
+    def execute(self):
+
+        payloads = [{"jsonrpc": "2.0", "id": request_id, "method": "eth_call", "params": [{"to": Web3.to_checksum_address(address), "data": data}, block_identifier]}
+                    for (address, data, block_identifier), request_id in self.requests.items()]
+
+        responses = {}
+
+        for i in range(0, len(payloads), self.batch_size):
+            chunk = payloads[i:i + self.batch_size]
+            logr.info(f"📦 Sending {len(chunk)} eth_call(s) in one batch")
+
+            answer = self.post(chunk)
+
+            # Some providers answer a batch they won't serve with a single error object.
+            if isinstance(answer, dict):
+                raise Exception(f"JSON-RPC batch rejected: {answer.get('error', answer)}")
+
+            for response in answer:
+                responses[response['id']] = response
+
+        for call in self.pending:
+            response = responses.get(call.request_id, {'error': 'no response'})
+            if 'error' in response:
+                call.error = response['error']
+            else:
+                call.value = call.decode(response['result'])
+            call.done = True
+
+        return self.pending
@@ -0,0 +1,85 @@
+import threading
+
+import numpy as np
+
+from .store import is_many
+
+def index_by(df, key):
+    """`df` sorted by `key`, and {value: (start, stop)} of its rows, so each value's rows are one slice."""
+
+    df = df.sort_values(key, kind='stable').reset_index(drop=True)
+    bounds = {value: (rows[0], rows[-1] + 1) for value, rows in df.groupby(key, sort=False).indices.items()}
+
+    return df, bounds
+
+def take(df, bounds, value):
+    """The rows of an `index_by` frame whose key equals `value`, or is in it if `value` is a list."""
+
+    if is_many(value):
+        rows = [np.arange(*bounds[v]) for v in dict.fromkeys(value) if v in bounds]
+        return df.iloc[np.concatenate(rows)] if rows else df.iloc[0:0]
+
+    start, stop = bounds.get(value, (0, 0))
+    return df.iloc[start:stop]
+
+
+class DataLoader:
+    """
+    Reads each table once per process, and hands every Proposal its own slice of it.
+
+    A table that's sliced by a key (eg. votes by proposal_id) is sorted by that key once, with the
+    [start, stop) rows of every key value kept alongside, so a proposal's votes are a plain row
+    range of the cached frame, not a filter over all of it.  Everything cached is dropped and
+    re-read as soon as the store says the table changed (eg. `follow` appended new votes).
+
+    A store that can read a slice on its own (Parquet partitions, SQLite indexes) is asked for just
+    that slice instead, unless the whole table was `preload`ed, eg. for a run over every proposal.
+
+    The frames handed out are shared with the cache, so callers add columns rather than edit rows.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+        self.tables = {}
+        self.indexes = {}
+        self.slices = {}
+        self.lock = threading.Lock()
+
+    def cached(self, cache, key, name, load):
+
+        with self.lock:
+            mtime = self.store.mtime(name)
+
+            entry = cache.get(key)
+            if entry is None or entry[0] != mtime:
+                entry = cache[key] = (mtime, load())
+
+        return entry[1]
+
+    def read(self, name):
+        """The whole table."""
+        return self.cached(self.tables, name, name, lambda: self.store.read(name))
+
+    def index(self, name, key):
+        """The whole table sorted by `key`, and {value: (start, stop)} of its rows."""
+
+        return self.cached(self.indexes, (name, key), name, lambda: index_by(self.store.read(name), key))
+
+    def preload(self, name, key):
+        self.index(name, key)
+
+    def select(self, name, key, value, columns=None):
+        """Rows of `name` whose `key` equals `value`, or is in it if `value` is a list."""
+
+        if self.store.partial_reads and (name, key) not in self.indexes:
+
+            if is_many(value):
+                return self.store.read(name, columns=columns, where={key: list(value)})
+
+            return self.cached(self.slices, (name, key, value, tuple(columns or ())), name,
+                               lambda: self.store.read(name, columns=columns, where={key: value}))
+
+        df = take(*self.index(name, key), value)
+
+        return df[columns] if columns else df
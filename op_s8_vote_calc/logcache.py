@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+from .checkpoint import subtract_ranges
+
+logr = logging.getLogger(__name__)
+
+HEX_FIELDS = ('data', 'blockHash', 'transactionHash')
+
+def resolve_log_cache_settings():
+
+    try:
+        max_bytes = int(os.getenv('S8_LOG_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+        assert max_bytes > 0
+    except:
+        max_bytes = 2 * 1024 ** 3
+
+    try:
+        finality_depth = int(os.getenv('S8_LOG_CACHE_FINALITY_DEPTH', 1024))
+        assert finality_depth >= 0
+    except:
+        finality_depth = 1024
+
+    return max_bytes, finality_depth
+
+def stream_key(chain_id, address, topics):
+
+    if isinstance(address, (list, tuple)):
+        address = sorted(a.lower() for a in address)
+    else:
+        address = address.lower()
+
+    if isinstance(topics, (list, tuple)):
+        topics = sorted(t.lower() for t in topics)
+    else:
+        topics = topics.lower()
+
+    return hashlib.sha256(json.dumps([int(chain_id), address, topics]).encode()).hexdigest()
+
+def to_cacheable(log):
+    return json.loads(Web3.to_json(log))
+
+def from_cacheable(log):
+
+    log = dict(log)
+
+    log['topics'] = [HexBytes(t) for t in log['topics']]
+
+    for field in HEX_FIELDS:
+        if field in log:
+            log[field] = HexBytes(log[field])
+
+    return AttributeDict(log)
+
+
+class LogCache:
+    """
+    Content-addressed on-disk cache of eth_getLogs responses.
+
+    Each response is stored under sha256(chain_id, address, topics, from_block, to_block), so the
+    same request always lands on the same file.  Callers only store ranges at or below the
+    finalized block, since those logs can never change.  Lookups go through a small index per
+    (chain_id, address, topics) stream, so a request whose window boundaries moved since the last
+    run (eg. because the span controller learned a different span) is still served from whatever
+    cached ranges cover it, and only the uncovered gaps go back to the provider.
+
+    Once the cache grows past `max_bytes`, least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, finality_depth=None):
+
+        default_max_bytes, default_finality_depth = resolve_log_cache_settings()
+
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes or default_max_bytes
+        self.finality_depth = default_finality_depth if finality_depth is None else finality_depth
+
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self.total_bytes = None
+
+    def index(self, stream):
+
+        if stream not in self.indexes:
+            fname = self.cache_dir / stream / 'index.json'
+            if fname.exists():
+                with open(fname, 'r') as f:
+                    self.indexes[stream] = json.load(f)
+            else:
+                self.indexes[stream] = []
+
+        return self.indexes[stream]
+
+    def save_index(self, stream):
+
+        fname = self.cache_dir / stream / 'index.json'
+        tmp = fname.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.indexes[stream], f)
+        os.replace(tmp, fname)
+
+    def lookup(self, chain_id, address, topics, from_block, to_block):
+        """Cached logs inside [from_block, to_block], and the sub-ranges that still need fetching."""
+
+        stream = stream_key(chain_id, address, topics)
+
+        with self.lock:
+            entries = [entry for entry in self.index(stream) if entry[1] >= from_block and entry[0] <= to_block]
+
+        logs = {}
+        covered = []
+
+        for entry_from_block, entry_to_block, key in entries:
+
+            fname = self.cache_dir / stream / (key + '.json.gz')
+
+            try:
+                with gzip.open(fname, 'rt') as f:
+                    cached = json.load(f)
+                os.utime(fname)
+            except (FileNotFoundError, ValueError, OSError):
+                with self.lock:
+                    self.indexes[stream] = [e for e in self.index(stream) if e[2] != key]
+                continue
+
+            for log in cached:
+                if from_block <= log['blockNumber'] <= to_block:
+                    logs[(log['blockNumber'], log['transactionIndex'], log['logIndex'])] = log
+            covered.append([entry_from_block, entry_to_block])
+
+        gaps = subtract_ranges(from_block, to_block, covered)
+
+        with self.lock:
+            if covered:
+                self.hits += 1
+            if gaps:
+                self.misses += 1
+
+        return [from_cacheable(log) for log in logs.values()], gaps
+
+    def store(self, chain_id, address, topics, from_block, to_block, logs):
+
+        stream = stream_key(chain_id, address, topics)
+        key = hashlib.sha256(json.dumps([stream, from_block, to_block]).encode()).hexdigest()
+
+        (self.cache_dir / stream).mkdir(parents=True, exist_ok=True)
+
+        fname = self.cache_dir / stream / (key + '.json.gz')
+        tmp = fname.with_suffix('.tmp')
+        with gzip.open(tmp, 'wt') as f:
+            json.dump([to_cacheable(log) for log in logs], f)
+        os.replace(tmp, fname)
+
+        with self.lock:
+            index = self.index(stream)
+            if not any(entry[2] == key for entry in index):
+                index.append([from_block, to_block, key])
+                index.sort()
+                self.save_index(stream)
+
+            self.stores += 1
+
+            if self.total_bytes is None:
+                self.total_bytes = sum(f.stat().st_size for f in self.cache_dir.glob('*/*.json.gz'))
+            else:
+                self.total_bytes += fname.stat().st_size
+
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes."""
+
+        entries = sorted(self.cache_dir.glob('*/*.json.gz'), key=lambda f: f.stat().st_mtime)
+
+        self.total_bytes = sum(f.stat().st_size for f in entries)
+
+        touched = set()
+
+        for fname in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+
+            stream, key = fname.parent.name, fname.name.replace('.json.gz', '')
+
+            self.total_bytes -= fname.stat().st_size
+            fname.unlink()
+
+            self.indexes[stream] = [entry for entry in self.index(stream) if entry[2] != key]
+            touched.add(stream)
+
+            self.evictions += 1
+
+        for stream in touched:
+            self.save_index(stream)
+
+    def report(self):
+        logr.info(f"🗄️ eth_getLogs cache: {self.hits} hit(s), {self.misses} miss(es), {self.stores} store(s), {self.evictions} eviction(s)")
@@ -7,6 +7,7 @@ PROPOSAL_CREATED_4 = 'ProposalCreated(uint256,address,address,bytes,uint256,uint
 PROPOSAL_CANCELED = 'ProposalCanceled(uint256)'
 PROPOSAL_QUEUED   = 'ProposalQueued(uint256,uint256)'
 PROPOSAL_EXECUTED = 'ProposalExecuted(uint256)'
+PROPOSAL_DEADLINE_UPDATED = 'ProposalDeadlineUpdated(uint256,uint64)'
 
 PROP_TYPE_SET_1 = 'ProposalTypeSet(uint8,uint16,uint16,string)'
 PROP_TYPE_SET_2 = 'ProposalTypeSet(uint256,uint16,uint16,string)'
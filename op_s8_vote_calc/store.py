@@ -0,0 +1,627 @@
+import csv
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Tables that are read one proposal at a time, and the column they're partitioned on.
+PARTITION_KEYS = {
+    'VoteCast(address,uint256,uint8,uint256,string)': 'proposal_id',
+    'VoteCastWithParams(address,uint256,uint8,uint256,string,bytes)': 'proposal_id',
+    'Vote': 'proposalId',
+}
+
+# uint256 / uint128 in the ABIs, but always block numbers or basis points, and compared as numbers.
+INT64_COLUMNS = {'start_block', 'end_block', 'criteria_value'}
+
+# Columns the SQLite store indexes, wherever a table has them.
+INDEXED_COLUMNS = ['proposal_id', 'proposalId', 'voter', 'refUID', 'id', 'block_number']
+
+def resolve_store_format():
+
+    store_format = os.getenv('S8_STORE', 'csv').lower()
+
+    if store_format not in ('csv', 'parquet', 'sqlite'):
+        raise Exception(f"❌ Unknown S8_STORE={store_format!r}, expected 'csv', 'parquet' or 'sqlite'")
+
+    return store_format
+
+def resolve_flush_rows():
+
+    try:
+        flush_rows = int(os.getenv('S8_STORE_FLUSH_ROWS', 50000))
+        assert flush_rows > 0
+    except:
+        flush_rows = 50000
+
+    return flush_rows
+
+def open_store(root, store_format=None):
+
+    store_format = store_format or resolve_store_format()
+
+    if store_format == 'parquet':
+        return ParquetStore(root)
+
+    if store_format == 'sqlite':
+        return SqliteStore(root)
+
+    return CsvStore(root)
+
+def signature_types(signature):
+    """ABI types of an event's fields, eg. ['address', 'uint256', ...] for 'VoteCast(address,uint256,...)'."""
+    return signature[signature.index('(') + 1:-1].split(',')
+
+def column_kind(column, abi_type):
+    """'int', 'bool' or 'str': how a column is stored by the typed stores."""
+
+    if column in INT64_COLUMNS:
+        return 'int'
+
+    if abi_type == 'bool':
+        return 'bool'
+
+    # Anything that fits goes in as int64; token amounts, ids and hashes overflow it, so they're
+    # kept as decimal strings, which is also how pandas hands them back from the CSVs.  That
+    # includes uint64 (eg. an EAS expirationTime of 2**64 - 1), whose top half int64 can't hold.
+    match = re.fullmatch(r'(u?)int(\d*)', abi_type)
+    if match and int(match.group(2) or 256) < (64 if match.group(1) else 65):
+        return 'int'
+
+    return 'str'
+
+def column_kinds(field_names, types=None):
+    types = types or ['string'] * len(field_names)
+    return {column: column_kind(column, abi_type) for column, abi_type in zip(field_names, types)}
+
+def to_value(value, kind):
+
+    if value is None or (isinstance(value, str) and value == ''):
+        return None
+
+    if kind == 'int':
+        return int(value)
+
+    if kind == 'bool':
+        return value if isinstance(value, bool) else str(value) == 'True'
+
+    # Same text csv.DictWriter would have written, eg. "[1, 2]" for a uint256[].
+    return str(value)
+
+def is_many(value):
+    return isinstance(value, (list, tuple, set))
+
+
+class CsvStore:
+    """
+    One CSV per table, eg. `VoteCast(address,uint256,uint8,uint256,string).csv`, exactly as it's always been.
+
+    Every read parses the whole file; `columns` and `where` only trim the DataFrame afterwards.
+    """
+
+    partial_reads = False
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, name):
+        return self.root / (name + '.csv')
+
+    def describe(self, name):
+        return str(self.path(name).absolute())
+
+    def exists(self, name):
+        fname = self.path(name)
+        return fname.exists() and fname.stat().st_size > 0
+
+    def mtime(self, name):
+        return self.path(name).stat().st_mtime_ns
+
+    def writer(self, name, field_names, types=None, append=False):
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        fname = self.path(name)
+
+        if append and self.exists(name):
+            fs = open(fname, mode='a', newline='')
+            print("Appending to: " + self.describe(name))
+            return CsvWriter(fs, field_names)
+
+        fs = open(fname, mode='w', newline='')
+        print("Creating/Overwriting: " + self.describe(name))
+        writer = CsvWriter(fs, field_names)
+        writer.writer.writeheader()
+        return writer
+
+    def read(self, name, columns=None, where=None):
+
+        df = pd.read_csv(self.path(name), usecols=columns)
+
+        for column, value in (where or {}).items():
+            df = df[df[column].isin(value)] if is_many(value) else df[df[column] == value]
+
+        return df
+
+    def rows(self, name):
+
+        with open(self.path(name), mode='r', newline='') as fs:
+            yield from csv.DictReader(fs)
+
+    def write(self, name, field_names, rows, types=None):
+
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        fname = self.path(name)
+
+        tmp = fname.with_suffix('.tmp')
+        with open(tmp, mode='w', newline='') as fs:
+            writer = csv.DictWriter(fs, fieldnames=field_names)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, fname)
+
+    def prune(self, name, keep_block):
+        """Drop the rows whose block_number `keep_block` rejects."""
+
+        fname = self.path(name)
+
+        with open(fname, mode='r', newline='') as fs:
+            reader = csv.DictReader(fs)
+            field_names = reader.fieldnames
+            rows = list(reader)
+
+        kept = [row for row in rows if keep_block(int(row['block_number']))]
+
+        if len(kept) == len(rows):
+            return
+
+        print(f"Dropping {len(rows) - len(kept)} row(s) from: " + self.describe(name))
+
+        # Rewritten in place, so an open append-mode writer (O_APPEND) keeps writing at the new end.
+        with open(fname, mode='w', newline='') as fs:
+            writer = csv.DictWriter(fs, fieldnames=field_names)
+            writer.writeheader()
+            writer.writerows(kept)
+
+
+class CsvWriter:
+
+    def __init__(self, fs, field_names):
+        self.fs = fs
+        self.writer = csv.DictWriter(fs, fieldnames=field_names)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def flush(self):
+        self.fs.flush()
+
+    def close(self):
+        self.fs.close()
+
+
+def arrow_schema(field_names, types=None):
+    arrow_types = {'int': pa.int64(), 'bool': pa.bool_(), 'str': pa.string()}
+    return pa.schema([(column, arrow_types[kind]) for column, kind in column_kinds(field_names, types).items()])
+
+def to_arrow_table(schema, rows):
+
+    kinds = {field.name: 'int' if pa.types.is_integer(field.type) else 'bool' if pa.types.is_boolean(field.type) else 'str' for field in schema}
+
+    columns = {column: [] for column in kinds}
+
+    for row in rows:
+        for column, kind in kinds.items():
+            columns[column].append(to_value(row.get(column), kind))
+
+    return pa.table(columns, schema=schema)
+
+
+class ParquetStore:
+    """
+    Typed, zstd compressed Parquet datasets, one directory per table.
+
+    Vote tables are split into one directory per proposal (`proposal_id=<id>/`), so loading a proposal's
+    votes opens only its own files, and only the columns asked for.  Every flush of a writer adds a
+    part file, named so that the parts sort in the order they were written.  `_schema.parquet` holds
+    the table's schema, so an empty table still reads back with its columns.
+    """
+
+    partial_reads = True
+
+    def __init__(self, root):
+
+        if pa is None:
+            raise Exception("❌ S8_STORE=parquet needs pyarrow, `pip install op-s8-vote-calc[parquet]`")
+
+        self.root = Path(root)
+
+    def path(self, name):
+        return self.root / name
+
+    def describe(self, name):
+        return str(self.path(name).absolute())
+
+    def exists(self, name):
+        return (self.path(name) / '_schema.parquet').exists()
+
+    def mtime(self, name):
+        # Every write adds or removes a part file, which bumps the mtime of its directory.
+        dirs = [self.path(name)] + [d for d in self.path(name).iterdir() if d.is_dir()]
+        return max(d.stat().st_mtime_ns for d in dirs)
+
+    def schema(self, name):
+        return pq.read_schema(self.path(name) / '_schema.parquet')
+
+    def parts(self, name, partition=None):
+
+        path = self.path(name)
+
+        if partition is not None:
+            path = path / f"{PARTITION_KEYS[name]}={partition}"
+
+        return sorted(path.glob('**/part-*.parquet'), key=lambda f: f.name)
+
+    def write_parts(self, name, table):
+
+        key = PARTITION_KEYS.get(name)
+
+        if key is None:
+            groups = [(self.path(name), table)]
+        else:
+            groups = []
+            values = table.column(key)
+            for value in pc.unique(values).to_pylist():
+                groups.append((self.path(name) / f"{key}={value}", table.filter(pc.equal(values, value))))
+
+        for path, group in groups:
+            path.mkdir(parents=True, exist_ok=True)
+            pq.write_table(group, path / f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet", compression='zstd')
+
+    def create(self, name, schema):
+
+        path = self.path(name)
+
+        if path.exists():
+            shutil.rmtree(path)
+
+        path.mkdir(parents=True)
+        pq.write_table(schema.empty_table(), path / '_schema.parquet')
+
+    def writer(self, name, field_names, types=None, append=False):
+
+        path = self.path(name)
+
+        if append and self.exists(name):
+            print("Appending to: " + self.describe(name))
+            return ParquetWriter(self, name, self.schema(name))
+
+        print("Creating/Overwriting: " + self.describe(name))
+        schema = arrow_schema(field_names, types)
+        self.create(name, schema)
+        return ParquetWriter(self, name, schema)
+
+    def read(self, name, columns=None, where=None):
+
+        if not self.exists(name):
+            raise FileNotFoundError(str(self.path(name)))
+
+        schema = self.schema(name)
+        where = dict(where or {})
+
+        partition = None
+        key = PARTITION_KEYS.get(name)
+        if key in where and not is_many(where[key]):
+            partition = where.pop(key)
+
+        parts = self.parts(name, partition)
+
+        if not parts:
+            table = schema.empty_table()
+            table = table.select(columns) if columns else table
+        else:
+            expression = None
+            for column, value in where.items():
+                term = pc.field(column).isin(pa.array(list(value), type=schema.field(column).type)) if is_many(value) else pc.field(column) == value
+                expression = term if expression is None else expression & term
+
+            table = ds.dataset(parts, schema=schema, format='parquet').to_table(columns=columns, filter=expression)
+
+        return table.to_pandas()
+
+    def rows(self, name):
+        for part in self.parts(name):
+            yield from pq.read_table(part).to_pylist()
+
+    def write(self, name, field_names, rows, types=None):
+
+        schema = arrow_schema(field_names, types)
+        table = to_arrow_table(schema, rows)
+
+        # Built next to the old table and swapped in, so a failed write leaves the old one intact.
+        tmp = ParquetStore(self.root / '.tmp')
+        tmp.create(name, schema)
+        if table.num_rows:
+            tmp.write_parts(name, table)
+
+        if self.path(name).exists():
+            shutil.rmtree(self.path(name))
+        os.replace(tmp.path(name), self.path(name))
+
+    def prune(self, name, keep_block):
+        """Drop the rows whose block_number `keep_block` rejects, rewriting only the parts that had any."""
+
+        dropped = 0
+
+        for part in self.parts(name):
+
+            table = pq.read_table(part)
+            block_numbers = table.column('block_number')
+
+            kept = [b for b in pc.unique(block_numbers).to_pylist() if keep_block(b)]
+            pruned = table.filter(pc.is_in(block_numbers, pa.array(kept, type=block_numbers.type)))
+
+            if pruned.num_rows == table.num_rows:
+                continue
+
+            dropped += table.num_rows - pruned.num_rows
+
+            if pruned.num_rows:
+                pq.write_table(pruned, part.with_suffix('.tmp'), compression='zstd')
+                os.replace(part.with_suffix('.tmp'), part)
+            else:
+                part.unlink()
+
+        if dropped:
+            print(f"Dropping {dropped} row(s) from: " + self.describe(name))
+
+
+class ParquetWriter:
+    """
+    Buffers rows, and writes them out as new part files on every flush.
+
+    The buffer is also flushed whenever it reaches `S8_STORE_FLUSH_ROWS` rows (default 50000), so a
+    long sync doesn't hold every row in memory.  Rows flushed before their range is recorded in the
+    checkpoint are pruned by the next incremental sync if this one doesn't finish, as with the CSVs.
+    """
+
+    def __init__(self, store, name, schema):
+        self.store = store
+        self.name = name
+        self.schema = schema
+        self.buffer = []
+        self.flush_rows = resolve_flush_rows()
+
+    def writerow(self, row):
+        self.buffer.append(row)
+
+        if len(self.buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+
+        if not self.buffer:
+            return
+
+        table = to_arrow_table(self.schema, self.buffer)
+        self.buffer = []
+
+        self.store.write_parts(self.name, table)
+
+    def close(self):
+        self.flush()
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteStore:
+    """
+    Every table in one SQLite database, `store.sqlite`, indexed on proposal ids, voters, refUIDs and ids.
+
+    Reads are queries, so loading a proposal's votes, or the citizens behind them, only touches the
+    rows asked for, through an index, rather than loading whole tables into memory.  Column kinds
+    (int / bool / str) are kept in `_tables`, next to a counter that's bumped on every write.
+    """
+
+    partial_reads = True
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.fname = self.root / 'store.sqlite'
+        self.local = threading.local()
+
+    def connect(self):
+
+        # sqlite3 connections can't be shared between threads, and schemas download in parallel.
+        if getattr(self.local, 'db', None) is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.fname, timeout=60)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS _tables (name TEXT PRIMARY KEY, kinds TEXT, version INTEGER)")
+            self.local.db = db
+
+        return self.local.db
+
+    def describe(self, name):
+        return f"{self.fname.absolute()} ({name})"
+
+    def exists(self, name):
+        return self.kinds(name) is not None
+
+    def kinds(self, name):
+        row = self.connect().execute("SELECT kinds FROM _tables WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mtime(self, name):
+
+        row = self.connect().execute("SELECT version FROM _tables WHERE name = ?", (name,)).fetchone()
+
+        if row is None:
+            raise FileNotFoundError(self.describe(name))
+
+        return row[0]
+
+    def touch(self, db, name):
+        db.execute("UPDATE _tables SET version = ? WHERE name = ?", (time.time_ns(), name))
+
+    def create(self, db, name, kinds):
+
+        sql_types = {'int': 'INTEGER', 'bool': 'INTEGER', 'str': 'TEXT'}
+
+        db.execute(f"DROP TABLE IF EXISTS {quote(name)}")
+        db.execute(f"CREATE TABLE {quote(name)} ({', '.join(quote(c) + ' ' + sql_types[k] for c, k in kinds.items())})")
+
+        for column in INDEXED_COLUMNS:
+            if column in kinds:
+                db.execute(f"CREATE INDEX {quote(name + '.' + column)} ON {quote(name)} ({quote(column)})")
+
+        db.execute("INSERT OR REPLACE INTO _tables VALUES (?, ?, ?)", (name, json.dumps(kinds), time.time_ns()))
+
+    def insert(self, db, name, kinds, rows):
+
+        columns = list(kinds)
+
+        db.executemany(f"INSERT INTO {quote(name)} ({', '.join(map(quote, columns))}) VALUES ({', '.join('?' * len(columns))})",
+                       ([to_value(row.get(c), kinds[c]) for c in columns] for row in rows))
+
+        self.touch(db, name)
+
+    def writer(self, name, field_names, types=None, append=False):
+
+        if append and self.exists(name):
+            print("Appending to: " + self.describe(name))
+            return SqliteWriter(self, name, self.kinds(name))
+
+        print("Creating/Overwriting: " + self.describe(name))
+
+        kinds = column_kinds(field_names, types)
+
+        db = self.connect()
+        with db:
+            self.create(db, name, kinds)
+
+        return SqliteWriter(self, name, kinds)
+
+    def query(self, name, columns=None, where=None):
+
+        kinds = self.kinds(name)
+
+        if kinds is None:
+            raise FileNotFoundError(self.describe(name))
+
+        columns = columns or list(kinds)
+
+        clauses = []
+        params = []
+        for column, value in (where or {}).items():
+            if is_many(value):
+                value = list(value)
+                clauses.append(f"{quote(column)} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{quote(column)} = ?")
+                params.append(value)
+
+        sql = f"SELECT {', '.join(map(quote, columns))} FROM {quote(name)}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+
+        return sql + " ORDER BY rowid", params, {c: kinds[c] for c in columns}
+
+    def read(self, name, columns=None, where=None):
+
+        sql, params, kinds = self.query(name, columns, where)
+
+        df = pd.read_sql_query(sql, self.connect(), params=params)
+
+        for column, kind in kinds.items():
+            if kind == 'bool':
+                df[column] = df[column].astype(bool)
+
+        return df
+
+    def rows(self, name):
+
+        sql, params, kinds = self.query(name)
+
+        for values in self.connect().execute(sql, params):
+            yield {c: bool(v) if kinds[c] == 'bool' and v is not None else v for c, v in zip(kinds, values)}
+
+    def write(self, name, field_names, rows, types=None):
+
+        kinds = column_kinds(field_names, types)
+
+        # One transaction, so readers see either the old table or the new one.
+        db = self.connect()
+        with db:
+            self.create(db, name, kinds)
+            self.insert(db, name, kinds, rows)
+
+    def prune(self, name, keep_block):
+        """Drop the rows whose block_number `keep_block` rejects."""
+
+        db = self.connect()
+
+        block_numbers = [b for (b,) in db.execute(f"SELECT DISTINCT block_number FROM {quote(name)}")]
+        dropped = [b for b in block_numbers if not keep_block(b)]
+
+        if not dropped:
+            return
+
+        with db:
+            count = 0
+            for i in range(0, len(dropped), 500):
+                chunk = dropped[i:i + 500]
+                count += db.execute(f"DELETE FROM {quote(name)} WHERE block_number IN ({', '.join('?' * len(chunk))})", chunk).rowcount
+            self.touch(db, name)
+
+        print(f"Dropping {count} row(s) from: " + self.describe(name))
+
+
+class SqliteWriter:
+    """Buffers rows, and inserts them in one transaction on every flush, or every `S8_STORE_FLUSH_ROWS` rows, like ParquetWriter."""
+
+    def __init__(self, store, name, kinds):
+        self.store = store
+        self.name = name
+        self.kinds = kinds
+        self.buffer = []
+        self.flush_rows = resolve_flush_rows()
+
+    def writerow(self, row):
+        self.buffer.append(row)
+
+        if len(self.buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+
+        if not self.buffer:
+            return
+
+        db = self.store.connect()
+        with db:
+            self.store.insert(db, self.name, self.kinds, self.buffer)
+
+        self.buffer = []
+
+    def close(self):
+        self.flush()
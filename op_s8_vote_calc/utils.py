@@ -3,6 +3,8 @@ from yaml import load, FullLoader
 from pathlib import Path
 from web3 import Web3
 
+from .connections import pool
+
 pattern = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
 def camel_to_snake(a_str):
     return pattern.sub('_', a_str).lower()
@@ -30,7 +32,7 @@ def get_web3():
     if rpc is None:
         raise Exception("S8_JSON_RPC environment variable is not set")
 
-    w3 = Web3(Web3.HTTPProvider(rpc))
+    w3 = pool.web3(rpc)
 
     return w3
     
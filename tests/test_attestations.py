@@ -0,0 +1,133 @@
+import pytest
+from eth_abi import decode, encode
+
+from op_s8_vote_calc import attestations
+from op_s8_vote_calc.attestations import Citizens, CreateProposal, Vote, decode_chunk
+
+VOTE = Vote('0x00')
+CITIZENS = Citizens('0x00')
+CREATE_PROPOSAL = CreateProposal('0x00')
+
+PROPOSAL = {'contract': '0x' + '11' * 20, 'proposalId': 7, 'proposer': '0x' + '22' * 20, 'description': 'A proposal\nwith a body',
+            'choices': ['yes', 'no', 'ünïcode'], 'proposal_type_id': 1, 'start_block': 10, 'end_block': 20, 'proposal_type': 'approval',
+            'tiers': [1000, 2000], 'onchain_proposalid': 0, 'max_approvals': 2, 'criteria': 1, 'criteria_value': 5000, 'calculation_options': 0}
+
+def payload(meta, values):
+    return '0x' + encode(list(meta.kwtypes.values()), values).hex()
+
+def vote(params, proposal_id=5):
+    return payload(VOTE, [proposal_id, params])
+
+def words(data):
+    encoded = bytes.fromhex(data[2:])
+    return [bytearray(encoded[i:i + 32]) for i in range(0, len(encoded), 32)]
+
+def join(words):
+    return '0x' + b''.join(words).hex()
+
+
+def test_valid_payloads_decode_like_eth_abi():
+
+    data = payload(CREATE_PROPOSAL, list(PROPOSAL.values()))
+
+    result = CREATE_PROPOSAL.decode(data)
+    expected = decode(list(CREATE_PROPOSAL.kwtypes.values()), bytes.fromhex(data[2:]))
+
+    assert list(result.values()) == [v.hex() if isinstance(v, bytes) else v for v in expected]
+    assert result['choices'] == ('yes', 'no', 'ünïcode')
+
+def test_bad_rows_are_reported_and_the_rest_decoded():
+
+    good = payload(CITIZENS, [1, '5.1'])
+
+    bad_offset = words(good)
+    bad_offset[1][-1] = 0xff
+
+    bad_utf8 = payload(CITIZENS, [1, 'x'])
+    bad_utf8 = bad_utf8[:-64] + 'ff' + bad_utf8[-62:]
+
+    datas = [good, 'not hex', '0x123', good[:-64], join(bad_offset), bad_utf8, good]
+
+    results, errors = decode_chunk(CITIZENS, datas, offset=100)
+
+    assert results[0] == results[-1] == {'FarcaserId': 1, 'SelectionMethod': '5.1'}
+    assert results[1:-1] == [None] * 5
+    assert [idx for idx, _ in errors] == [101, 102, 103, 104, 105]
+
+@pytest.mark.parametrize('types, values, word, value', [
+    (['uint8', 'string'], [1, 'x'], 0, 0x01),        # uint8 with a non-zero high byte
+    (['address', 'string'], ['0x' + '11' * 20, 'x'], 0, 0x01),
+])
+def test_non_empty_padding_is_reported(types, values, word, value):
+
+    meta = attestations.AttestionMeta('0x00', a=types[0], b=types[1])
+
+    data = words(payload(meta, values))
+    data[word][0] = value
+
+    encoded, error = meta.check(join(data))
+
+    assert error is not None
+    with pytest.raises(Exception):
+        decode(types, bytes.fromhex(join(data)[2:]))
+
+def test_array_length_past_the_payload_is_reported():
+
+    data = words(payload(CREATE_PROPOSAL, list(PROPOSAL.values())))
+
+    # The head word of 'tiers' points at its length; make it claim far more items than there are.
+    tiers_offset = int.from_bytes(data[9], 'big')
+    data[tiers_offset // 32][-8:] = b'\xff' * 8
+
+    results, errors = decode_chunk(CREATE_PROPOSAL, [join(data)])
+
+    assert results == [None]
+    assert 'run past the end' in errors[0][1]
+
+def test_rows_the_checks_miss_are_dropped_one_by_one(monkeypatch):
+
+    good = vote('[1]')
+    bad = vote('[1]')[:-64]
+
+    # Let everything through the checks, as if the validator missed a case.
+    monkeypatch.setattr(Vote, 'check', lambda self, data: (bytes.fromhex(data[2:]), None))
+
+    results, errors = decode_chunk(VOTE, [good, bad, good])
+
+    assert results == [{'proposalId': 5, 'params': [1]}, None, {'proposalId': 5, 'params': [1]}]
+    assert [idx for idx, _ in errors] == [1]
+
+@pytest.mark.parametrize('params, expected', [
+    ('[1, 2, 3]', [1, 2, 3]),
+    ('["1", "2"]', [1, 2]),
+    ('[]', []),
+    ('[1.0]', [1]),
+    ('[1e2]', [100]),
+    ('[" +1 "]', [1]),
+])
+def test_vote_params_accepted_as_always(params, expected):
+    assert VOTE.decode(vote(params))['params'] == expected
+
+@pytest.mark.parametrize('params', ['nope', '5', '[1, "x"]', '{"a": 1}'])
+def test_bad_vote_params_are_reported(params):
+
+    results, errors = decode_chunk(VOTE, [vote('[1]'), vote(params), vote('[2]')])
+
+    assert [result and result['params'] for result in results] == [[1], None, [2]]
+    assert [idx for idx, _ in errors] == [1]
+
+def test_decode_raises_on_a_bad_payload():
+    with pytest.raises(ValueError):
+        VOTE.decode('0x00')
+
+def test_process_pool_keeps_rows_in_order(monkeypatch):
+
+    monkeypatch.setattr(attestations, 'MIN_ROWS_PER_PROCESS', 2)
+
+    datas = [vote(f'[{i}]', proposal_id=i) for i in range(6)]
+    datas[3] = 'bad'
+
+    results, errors = VOTE.decode_batch(datas, processes=2)
+
+    assert [result and result['proposalId'] for result in results] == [0, 1, 2, None, 4, 5]
+    assert [idx for idx, _ in errors] == [3]